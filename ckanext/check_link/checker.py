@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import abc
+import asyncio
+import contextlib
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Mapping, Optional
+from urllib.parse import urlsplit
+
+import check_link
+import httpx
+from check_link import AsyncChecker, State, check_all
+
+from . import metrics
+
+
+@dataclass
+class Link(check_link.Link):
+    """Link that remembers validators of the response.
+
+    When `etag` or `last_modified` are known before the check, the request is
+    made conditional and `304 Not Modified` response is treated as
+    available link.
+
+    """
+
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # seconds spent on the request, excluding time spent waiting for a slot
+    elapsed: Optional[float] = None
+
+    def use_validators(self, etag: Optional[str], last_modified: Optional[str]):
+        self.etag = etag
+        self.last_modified = last_modified
+
+        if etag:
+            self.headers["If-None-Match"] = etag
+
+        if last_modified:
+            self.headers["If-Modified-Since"] = last_modified
+
+    @property
+    def is_conditional(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    def state_from_code(
+        self, code: int, reason: Optional[str], headers: Mapping[str, Any]
+    ):
+        if code == 304 and self.is_conditional:
+            self.state = State.available
+            self.details = "Link is available and was not modified"
+            self.code = code
+            self.reason = reason
+            self.etag = headers.get("ETag") or self.etag
+            self.last_modified = headers.get("Last-Modified") or self.last_modified
+            return
+
+        super().state_from_code(code, reason, headers)
+        self.etag = headers.get("ETag")
+        self.last_modified = headers.get("Last-Modified")
+
+
+class HostScheduler:
+    """Politeness rules for requests sent to the same host.
+
+    No more than `concurrency` requests are sent to the same host
+    simultaneously and every next request to the host starts at least
+    `interval` seconds after the previous one. Zero disables the
+    corresponding limit.
+
+    """
+
+    def __init__(self, concurrency: int = 0, interval: float = 0):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._next_start: dict[str, float] = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        if not self.concurrency:
+            await self._wait_turn(host)
+            yield
+            return
+
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.concurrency)
+
+        async with self._semaphores[host]:
+            await self._wait_turn(host)
+            yield
+
+    async def _wait_turn(self, host: str):
+        if not self.interval:
+            return
+
+        # the slot is reserved before sleeping, so concurrent requests to the
+        # same host are queued one after another
+        now = asyncio.get_running_loop().time()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + self.interval
+
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+@dataclass
+class Checker(AsyncChecker):
+    """Asynchronous checker that limits number of simultaneous requests.
+
+    `concurrency` limits the total number of requests in flight, while
+    `host_concurrency` and `host_interval` are applied to every host
+    separately. Zero disables the corresponding limit.
+
+    """
+
+    concurrency: int = 0
+    host_concurrency: int = 0
+    host_interval: float = 0
+    _semaphore: Optional[asyncio.Semaphore] = field(
+        default=None, init=False, repr=False
+    )
+    _scheduler: HostScheduler = field(init=False, repr=False)
+
+    def __post_init__(self):
+        super().__post_init__()
+        if self.concurrency:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._scheduler = HostScheduler(self.host_concurrency, self.host_interval)
+
+    async def check(self, link: Link) -> Link:
+        host = urlsplit(link.link).hostname or ""
+
+        # host slot is taken first, so that requests waiting for a busy host
+        # do not occupy global slots needed by other hosts
+        async with self._scheduler.slot(host):
+            if not self._semaphore:
+                return await self._timed_check(link, host)
+
+            async with self._semaphore:
+                return await self._timed_check(link, host)
+
+    async def _timed_check(self, link: Link, host: str) -> Link:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        metrics.requests_in_flight.inc()
+        try:
+            return await super().check(link)
+        finally:
+            metrics.requests_in_flight.dec()
+            link.elapsed = loop.time() - start
+            metrics.observe_link(link.link, host, link.state.name, link.elapsed)
+
+    async def _ping(self, link: Link, headers: dict[str, str]) -> httpx.Response:
+        resp = await super()._ping(link, headers)
+        # HEAD request is repeated as GET when server does not allow HEAD
+        if self.options & check_link.Option.try_head and resp.request.method == "GET":
+            metrics.retries.inc(reason="head_not_allowed")
+        return resp
+
+
+class Engine(abc.ABC):
+    """Strategy that runs checkers over the list of links."""
+
+    @abc.abstractmethod
+    def check(
+        self, links: list[Link], checker_factory: Callable[..., Checker]
+    ) -> list[Link]:
+        ...
+
+    def close(self):
+        pass
+
+
+class BasicEngine(Engine):
+    """Check every batch in a new event loop with a new HTTP client."""
+
+    def check(
+        self, links: list[Link], checker_factory: Callable[..., Checker]
+    ) -> list[Link]:
+        return list(check_all(links, checker_factory))
+
+
+class AsyncEngine(Engine):
+    """Reuse the event loop and pooled keep-alive HTTP client between batches.
+
+    Connections to the same host stay open between calls of `check`, so
+    the engine is meant to be created once per run and closed at the end.
+
+    """
+
+    def __init__(self, max_connections: int = 100, max_keepalive: int = 20):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or None,
+            max_keepalive_connections=max_keepalive or None,
+        )
+        self._loop = asyncio.new_event_loop()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def check(
+        self, links: list[Link], checker_factory: Callable[..., Checker]
+    ) -> list[Link]:
+        return self._loop.run_until_complete(self._check(links, checker_factory))
+
+    async def _check(
+        self, links: list[Link], checker_factory: Callable[..., Checker]
+    ) -> list[Link]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(limits=self.limits)
+
+        # checker is not closed, because it would close the shared client
+        checker = checker_factory(session=self._client)
+        return list(await asyncio.gather(*map(checker.check, links)))
+
+    def close(self):
+        if self._loop.is_closed():
+            return
+
+        if self._client is not None:
+            self._loop.run_until_complete(self._client.aclose())
+            self._client = None
+
+        self._loop.close()
@@ -1,21 +1,39 @@
 from __future__ import annotations
 
+import contextlib
+import functools
+import json
 import logging
+import re
+import sys
+import time
 from collections import Counter
 from itertools import islice
-from typing import Iterable, TypeVar
+from typing import IO, Any, Iterable, Iterator, Optional, TypeVar
 
 from datetime import datetime
 from datetime import date
+from datetime import timedelta
 
 import ckan.model as model
 import ckan.plugins.toolkit as tk
 import click
-from .model import Report
+import sqlalchemy as sa
+from . import metrics, profiling
+from .model import Report, Run
+from .logic.action.check import make_engine
+from .utils import CheckMemo, resource_url
+from .workers import ChunkProcessor
 
 T = TypeVar("T")
 log = logging.getLogger(__name__)
 
+# reports that were never created are considered to be the oldest ones
+NEVER_CHECKED = datetime(1970, 1, 1)
+
+# number of rows fetched from the server-side cursor at once
+STREAM_BATCH_SIZE = 1000
+
 
 def get_commands():
     return [check_link]
@@ -27,6 +45,255 @@ def check_link(ctx):
     pass
 
 
+class Duration(click.ParamType):
+    name = 'duration'
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+    def get_metavar(self, param):
+        return 'N[s|m|h|d|w]'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, timedelta):
+            return value
+
+        match = re.fullmatch(r"(\d+)([smhdw]?)", str(value).strip())
+        if not match:
+            self.fail('invalid duration: {}. (e.g. 90, 30m, 12h, 7d)'.format(value))
+
+        amount, unit = match.groups()
+        return timedelta(seconds=int(amount) * self.units[unit or "s"])
+
+    def __repr__(self):
+        return 'Duration'
+
+
+max_age_option = click.option(
+    "-a",
+    "--max-age",
+    type=Duration(),
+    help="Skip links checked more recently than this. Stalest links go first",
+)
+
+
+class Shard(click.ParamType):
+    name = 'shard'
+
+    def get_metavar(self, param):
+        return 'I/N'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, tuple):
+            return value
+
+        match = re.fullmatch(r"(\d+)/(\d+)", str(value).strip())
+        if not match:
+            self.fail('invalid shard: {}. (e.g. 0/4)'.format(value))
+
+        index, total = map(int, match.groups())
+        if not 0 <= index < total:
+            self.fail('shard index must be between 0 and {}'.format(total - 1))
+
+        return index, total
+
+    def __repr__(self):
+        return 'Shard'
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+batch_size_option = click.option(
+    "-b",
+    "--batch-size",
+    default=DEFAULT_BATCH_SIZE,
+    help="Number of reports deleted in a single transaction",
+    type=click.IntRange(1),
+)
+dry_run_option = click.option(
+    "--dry-run", is_flag=True, help="Only count reports that would be deleted"
+)
+workers_option = click.option(
+    "-w",
+    "--workers",
+    default=1,
+    help="Number of processes that check chunks in parallel",
+    type=click.IntRange(1),
+)
+shard_option = click.option(
+    "-s",
+    "--shard",
+    type=Shard(),
+    help="Process only I-th of N deterministic parts of the scope, e.g. 0/4",
+)
+resume_option = click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue the last interrupted run with the same parameters",
+)
+due_option = click.option(
+    "--due",
+    is_flag=True,
+    help="Check only links that are due according to the recheck schedule",
+)
+
+
+def output_option(func):
+    """Add `--output` option that receives results of checks as JSON lines.
+
+    When results are written to stdout, progress and other messages are
+    sent to stderr instead.
+
+    """
+
+    @click.option(
+        "-o",
+        "--output",
+        type=click.File("w"),
+        help="Write result of every check as JSON line into the file. Use - for stdout",
+    )
+    @functools.wraps(func)
+    def wrapper(*args, output: Optional[IO[str]] = None, **kwargs):
+        if getattr(output, "name", None) != "<stdout>":
+            return func(*args, output=output, **kwargs)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            return func(*args, output=output, **kwargs)
+
+    return wrapper
+
+
+def metrics_file_option(func):
+    """Add `--metrics-file` option that enables collection of metrics.
+
+    Metrics are written in Prometheus text format after every chunk(at most
+    once per `METRICS_INTERVAL` seconds) and at the end of the run.
+
+    """
+
+    @click.option(
+        "--metrics-file",
+        type=click.Path(dir_okay=False, writable=True),
+        help="Periodically write metrics in Prometheus text format into the file",
+    )
+    @functools.wraps(func)
+    def wrapper(*args, metrics_file: Optional[str] = None, **kwargs):
+        if not metrics_file:
+            return func(*args, **kwargs)
+
+        _metrics_target.update(path=metrics_file, written=0.0)
+        metrics.registry.active = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _dump_metrics(force=True)
+            metrics.registry.active = False
+            _metrics_target.clear()
+
+    return wrapper
+
+
+def profile_option(func):
+    """Add `--profile` option that prints timings of the run at exit."""
+
+    @click.option(
+        "--profile",
+        is_flag=True,
+        help="Print time spent in every phase, slowest links and query counts",
+    )
+    @click.option(
+        "--profile-output",
+        type=click.File("w"),
+        help="Write profile as JSON into the file. Implies --profile",
+    )
+    @click.option(
+        "--profile-top",
+        default=profiling.DEFAULT_TOP,
+        help="Number of slowest URLs, hosts and chunks in the profile",
+        type=click.IntRange(1),
+    )
+    @functools.wraps(func)
+    def wrapper(
+        *args,
+        profile: bool = False,
+        profile_output: Optional[IO[str]] = None,
+        profile_top: int = profiling.DEFAULT_TOP,
+        **kwargs,
+    ):
+        if not (profile or profile_output):
+            return func(*args, **kwargs)
+
+        current = profiling.start(profile_top)
+        sa.event.listen(model.meta.engine, "before_cursor_execute", _count_query)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sa.event.remove(model.meta.engine, "before_cursor_execute", _count_query)
+            profiling.stop()
+            data = current.as_dict()
+            _echo_profile(data)
+            if profile_output:
+                json.dump(data, profile_output, indent=2)
+
+    return wrapper
+
+
+def _count_query(*args: Any):
+    profile = profiling.active()
+    if profile is not None:
+        profile.add_query()
+
+
+def _echo_profile(data: dict[str, Any]):
+    wall = data["wall_time"]
+    click.secho(f"Profile. Wall time: {wall:.2f}s", bold=True)
+
+    click.echo("Phases:")
+    for name, phase in data["phases"].items():
+        share = phase["seconds"] / wall * 100 if wall else 0
+        click.echo(
+            f"  {name:<12} {phase['seconds']:>10.2f}s {share:>6.1f}%"
+            f" {phase['count']:>8} calls"
+        )
+
+    click.echo("Slowest URLs:")
+    for link in data["slowest_urls"]:
+        click.echo(f"  {link['seconds']:>8.2f}s {link['url']}")
+
+    click.echo("Slowest hosts:")
+    for host in data["slowest_hosts"]:
+        click.echo(
+            f"  {host['seconds']:>8.2f}s total, {host['average']:.2f}s avg,"
+            f" {host['max']:.2f}s max, {host['links']} links: {host['host']}"
+        )
+
+    queries = data["queries"]
+    click.echo(
+        f"Queries: {queries['total']} in {queries['chunks']} chunks,"
+        f" {queries['per_chunk']:.1f} per chunk"
+    )
+    for chunk in queries["busiest_chunks"]:
+        click.echo(
+            f"  chunk {chunk['chunk']}: {chunk['queries']} queries,"
+            f" {chunk['items']} items, {chunk['seconds']:.2f}s"
+        )
+
+
+# seconds between writes of the metrics file
+METRICS_INTERVAL = 15
+_metrics_target: dict[str, Any] = {}
+
+
+def _dump_metrics(force: bool = False):
+    if not _metrics_target:
+        return
+
+    now = time.monotonic()
+    if not force and now - _metrics_target["written"] < METRICS_INTERVAL:
+        return
+
+    metrics.write(_metrics_target["path"])
+    _metrics_target["written"] = now
+
+
 @check_link.command()
 @click.option(
     "-d", "--include-draft", is_flag=True, help="Check draft packages as well"
@@ -44,15 +311,41 @@ def check_link(ctx):
     ),
 )
 @click.option(
-    "-d", "--delay", default=0, help="Delay between requests", type=click.FloatRange(0)
+    "-d",
+    "--delay",
+    default=0,
+    help="Minimal interval between requests to the same host",
+    type=click.FloatRange(0),
+)
+@click.option(
+    "--host-concurrency",
+    default=0,
+    help="Maximum number of simultaneous requests to the same host",
+    type=click.IntRange(0),
 )
 @click.option(
     "-t", "--timeout", default=60, help="Request timeout", type=click.FloatRange(0)
 )
+@max_age_option
+@due_option
+@resume_option
+@workers_option
+@shard_option
+@click.option(
+    "--source",
+    type=click.Choice(["search", "db"]),
+    default="search",
+    help="Read resources of packages from the search index or directly from DB",
+)
+@output_option
+@metrics_file_option
+@profile_option
 @click.argument("ids", nargs=-1)
 def check_packages(
         include_draft: bool, include_private: bool, ids: tuple[str, ...], chunk: int,
-        delay: float, timeout: float
+        delay: float, host_concurrency: int, timeout: float,
+        max_age: Optional[timedelta], due: bool, resume: bool, workers: int,
+        shard: Optional[tuple[int, int]], source: str, output: Optional[IO[str]],
 ):
     """Check every resource inside each package.
 
@@ -61,9 +354,16 @@ def check_packages(
 
     """
     user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
-    context = {"user": user["name"]}
-
-    check = tk.get_action("check_link_search_check")
+    context = {
+        "user": user["name"],
+        "check_link_memo": CheckMemo(),
+        "check_link_engine": make_engine(),
+    }
+    processor = ChunkProcessor(
+        "check_link_db_check" if source == "db" else "check_link_search_check",
+        context,
+        workers,
+    )
     states = ["active"]
 
     if include_draft:
@@ -79,26 +379,72 @@ def check_packages(
     if ids:
         q = q.filter(model.Package.id.in_(ids) | model.Package.name.in_(ids))
 
-    stats = Counter()
-    with click.progressbar(q, length=q.count()) as bar:
-        while True:
-            buff = _take(bar, chunk)
-            if not buff:
-                break
-
-            result = check(
-                context.copy(),
-                {
-                    "fq": "id:({})".format(" OR ".join(p.id for p in buff)),
-                    "save": True,
-                    "clear_available": False,
-                    "include_drafts": include_draft,
-                    "include_private": include_private,
-                    "skip_invalid": True,
-                    "rows": chunk,
-                    "link_patch": {"delay": delay, "timeout": timeout},
-                },
+    if shard:
+        q = _filter_shard(q, model.Package.id, shard)
+
+    if max_age or due:
+        oldest = sa.func.min(_last_checked())
+        earliest = sa.func.min(_next_check_at())
+        q = (
+            q.join(
+                model.Resource,
+                sa.and_(
+                    model.Resource.package_id == model.Package.id,
+                    model.Resource.state == "active",
+                ),
             )
+            .outerjoin(Report, Report.resource_id == model.Resource.id)
+            .group_by(model.Package.id)
+        )
+        if max_age:
+            q = q.having(oldest < datetime.utcnow() - max_age)
+        if due:
+            q = q.having(earliest <= datetime.utcnow())
+
+        q = q.order_by(earliest if due else oldest)
+
+    run = _start_run(
+        "check-packages",
+        {
+            "ids": sorted(ids),
+            "include_draft": include_draft,
+            "include_private": include_private,
+            **_max_age_params(max_age),
+            "due": due,
+            "shard": "{}/{}".format(*shard) if shard else None,
+        },
+        resume,
+    )
+    if not (max_age or due):
+        q = _continue_run(q, model.Package.id, run)
+
+    def make_payload(buff: list[Any]) -> dict[str, Any]:
+        if source == "db":
+            scope: dict[str, Any] = {"ids": [p.id for p in buff]}
+        else:
+            scope = {
+                "fq": "id:({})".format(" OR ".join(p.id for p in buff)),
+                "rows": chunk,
+                "keyset": True,
+            }
+
+        return {
+            **scope,
+            "save": True,
+            "clear_available": False,
+            "include_drafts": include_draft,
+            "include_private": include_private,
+            "skip_invalid": True,
+            "link_patch": {"timeout": timeout},
+            **_scheduler_params(delay, host_concurrency),
+            **_max_age_params(max_age),
+            "due_only": due,
+        }
+
+    stats = Counter(run.stats)
+    with click.progressbar(_stream(q), length=_count(q)) as bar:
+        for buff, result in processor.process(bar, chunk, make_payload):
+            _write_results(output, result)
             stats.update(r["state"] for r in result)
             overview = (
                 ", ".join(
@@ -109,14 +455,152 @@ def check_packages(
                 or "not available"
             )
             bar.label = f"Overview: {overview}"
+            _advance_run(run, buff[-1].id, len(buff), stats)
 
+    _finish_run(run)
+    context["check_link_engine"].close()
     click.secho("Done", fg="green")
+    _echo_memo_stats(processor.unique, processor.hits, processor.skipped)
 
 
 def _take(seq: Iterable[T], size: int) -> list[T]:
     return list(islice(seq, size))
 
 
+def _scheduler_params(delay: float, host_concurrency: int) -> dict[str, Any]:
+    """Per-host limits for url_check. Missing values are taken from config."""
+    params: dict[str, Any] = {}
+    if delay:
+        params["host_interval"] = delay
+
+    if host_concurrency:
+        params["host_concurrency"] = host_concurrency
+
+    return params
+
+
+def _max_age_params(max_age: Optional[timedelta]) -> dict[str, Any]:
+    if not max_age:
+        return {}
+
+    return {"max_age": int(max_age.total_seconds())}
+
+
+def _last_checked():
+    return sa.func.coalesce(Report.last_checked, NEVER_CHECKED)
+
+
+def _next_check_at():
+    return sa.func.coalesce(Report.next_check_at, NEVER_CHECKED)
+
+
+def _filter_reports(q, max_age: Optional[timedelta], due: bool):
+    """Apply --max-age and --due to the query joined with reports."""
+    if max_age:
+        q = q.filter(_last_checked() < datetime.utcnow() - max_age)
+
+    if due:
+        q = q.filter(_next_check_at() <= datetime.utcnow())
+
+    return q.order_by(_next_check_at() if due else _last_checked())
+
+
+def _start_run(command: str, params: dict[str, Any], resume: bool) -> Run:
+    """Create a new run or pick the last interrupted one."""
+    run = Run.last_unfinished(command, params) if resume else None
+
+    if run:
+        click.secho(
+            f"Resuming run {run.id} after {run.processed} processed items",
+            fg="yellow",
+        )
+    else:
+        if resume:
+            click.secho("Interrupted run not found. Starting a new one", fg="yellow")
+        run = Run(command=command, params=params)
+        model.Session.add(run)
+        model.Session.commit()
+        click.echo(f"Run ID: {run.id}")
+
+    return run
+
+
+def _continue_run(q, column: Any, run: Run):
+    """Order query by unique column and skip items processed by the run."""
+    q = q.order_by(column)
+    if run.checkpoint:
+        q = q.filter(column > run.checkpoint)
+
+    return q
+
+
+def _advance_run(run: Run, checkpoint: str, processed: int, stats: Counter):
+    with metrics.phase("checkpoint"):
+        run.advance(checkpoint, processed, stats)
+        # session is removed before forking workers, so the run may be detached
+        model.Session.add(run)
+        model.Session.commit()
+
+    profile = profiling.active()
+    if profile is not None:
+        profile.chunk_done(processed)
+
+    _dump_metrics()
+
+
+def _finish_run(run: Run):
+    run.finish()
+    model.Session.add(run)
+    model.Session.commit()
+
+
+def _filter_shard(q, column: Any, shard: tuple[int, int]):
+    """Split scope into deterministic parts using hash of the unique column."""
+    index, total = shard
+    return q.filter(sa.func.abs(sa.func.mod(sa.func.hashtext(column), total)) == index)
+
+
+def _stream(q) -> Iterator[Any]:
+    """Iterate over rows of the query using server-side cursor.
+
+    Cursor lives on its own connection, so commits made by checks and by
+    the run checkpoint do not close it, and connections disposed before
+    forking workers are not affected. Only `STREAM_BATCH_SIZE` rows are
+    kept in memory at once.
+
+    """
+    with model.meta.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(q.statement)
+        while True:
+            with metrics.phase("enumerate"):
+                rows = result.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield from rows
+
+
+def _count(q) -> int:
+    """Size of the scope for the progress bar."""
+    return q.order_by(None).count()
+
+
+def _write_results(output: Optional[IO[str]], results: Iterable[dict[str, Any]]):
+    if output is None:
+        return
+
+    for result in results:
+        output.write(json.dumps(result, default=str) + "\n")
+    output.flush()
+
+
+def _echo_memo_stats(unique: int, hits: int, skipped: int):
+    click.echo(
+        f"Unique URLs checked: {click.style(str(unique), bold=True)}."
+        f" Results reused: {click.style(str(hits), bold=True)}."
+        f" Skipped as fresh: {click.style(str(skipped), bold=True)}"
+    )
+
+
 class Date(click.ParamType):
     name = 'date'
 
@@ -149,7 +633,9 @@ class Date(click.ParamType):
     def __repr__(self):
         return 'Date'
 
-def _purge_stale_applications( older_than ):
+def _purge_stale_applications(
+    older_than, batch_size: int = DEFAULT_BATCH_SIZE, dry_run: bool = False
+):
     """ When a URL is changed on an application, the check-link record for the old URL remains in the check_link_report table. 
     This function is used to remove check-link records for application links that have not been checked since 'older_than'.
     This function is called immediately after doing a check-applications with older_than set to the datetime when the check-applications process began.
@@ -166,20 +652,47 @@ def _purge_stale_applications( older_than ):
         Report.last_checked < older_than
     )
 
-    if q.count() == 0:
+    total = _delete_reports(q, batch_size, dry_run)
+    if total == 0:
         log.info( 'No stale resource records found.' )
+    elif dry_run:
+        log.info( '{} stale check_link application resource records would be deleted.'.format( total ) )
     else:
-        log.info( '{} stale check_link application resource records found.'.format( q.count() ) )
+        log.info( '{} stale check_link application resource records deleted.'.format( total ) )
+
+
+def _delete_reports(q, batch_size: int, dry_run: bool) -> int:
+    """Delete reports selected by the query, `batch_size` rows per transaction.
+
+    Returns the number of selected reports. Nothing is deleted when
+    `dry_run` is set.
+
+    """
+    ids = q.with_entities(Report.id).order_by(Report.id)
+    total = ids.count()
+    if dry_run:
+        click.echo(f"Reports to delete: {click.style(str(total), bold=True)}")
+
+    if dry_run or not total:
+        return total
+
+    user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    context = {"user": user["name"]}
+    action = tk.get_action("check_link_report_delete_many")
 
-        user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
-        context = {"user": user["name"]}
+    last: Optional[str] = None
+    with click.progressbar(length=total) as bar:
+        while True:
+            batch_q = ids if last is None else ids.filter(Report.id > last)
+            batch = [id_ for id_, in batch_q.limit(batch_size)]
+            if not batch:
+                break
 
-        action = tk.get_action("check_link_report_delete")
+            action(context.copy(), {"id": batch})
+            bar.update(len(batch))
+            last = batch[-1]
 
-        with click.progressbar(q, length=q.count()) as bar:
-            for report in bar:
-                log.info( 'Deleting check_link record for record {}'.format( report.id ) )
-                action(context.copy(), {"id": report.id})
+    return total
 
 
 @check_link.command()
@@ -199,7 +712,17 @@ def _purge_stale_applications( older_than ):
     ),
 )
 @click.option(
-    "-d", "--delay", default=0, help="Delay between requests", type=click.FloatRange(0)
+    "-d",
+    "--delay",
+    default=0,
+    help="Minimal interval between requests to the same host",
+    type=click.FloatRange(0),
+)
+@click.option(
+    "--host-concurrency",
+    default=0,
+    help="Maximum number of simultaneous requests to the same host",
+    type=click.IntRange(0),
 )
 @click.option(
     "-t", "--timeout", default=60, help="Request timeout", type=click.FloatRange(0)
@@ -207,10 +730,21 @@ def _purge_stale_applications( older_than ):
 @click.option(
     "-i", "--ignore-local-resources", is_flag=True, help="Do not check resources hosted locally"
 )
+@max_age_option
+@due_option
+@resume_option
+@workers_option
+@shard_option
+@output_option
+@metrics_file_option
+@profile_option
 @click.argument("ids", nargs=-1)
 def check_applications(
         include_draft: bool, include_private: bool, ids: tuple[str, ...], chunk: int,
-        delay: float, timeout: float,  ignore_local_resources: bool,
+        delay: float, host_concurrency: int, timeout: float,
+        ignore_local_resources: bool, max_age: Optional[timedelta], due: bool,
+        resume: bool, workers: int, shard: Optional[tuple[int, int]],
+        output: Optional[IO[str]],
 ):
     """Check every application link.
 
@@ -218,13 +752,16 @@ def check_applications(
     application's ID or name.
 
     """
-    start_time = datetime.now()
+    start_time = datetime.utcnow()
     site_url = tk.config.get('ckan.site_url')
 
     user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
-    context = {"user": user["name"]}
-
-    check = tk.get_action("check_link_application_check")
+    context = {
+        "user": user["name"],
+        "check_link_memo": CheckMemo(),
+        "check_link_engine": make_engine(),
+    }
+    processor = ChunkProcessor("check_link_application_check", context, workers)
     states = ["active"]
     types = ["application"]
 
@@ -249,23 +786,41 @@ def check_applications(
         # Ignore resources that don't start with http
         q = q.filter(~(model.Package.url.notlike("http%")))
 
+    if shard:
+        q = _filter_shard(q, model.Package.id, shard)
+
+    if max_age or due:
+        q = _filter_reports(
+            q.outerjoin(
+                Report,
+                sa.and_(Report.url == model.Package.url, Report.resource_id.is_(None)),
+            ),
+            max_age,
+            due,
+        )
 
-    log.info( 'APPLICATIONS TO CHECK:')
-    for result in q:
-        log.info("{name}".format(name=result.title))
-
-    
-    stats = Counter()
-    with click.progressbar(q, length=q.count()) as bar:
-        while True:
-
-            buff = _take(bar, chunk)
-            if not buff:
-                break
-
-            result = check(
-                context.copy(),
-                {
+    run = _start_run(
+        "check-applications",
+        {
+            "ids": sorted(ids),
+            "include_draft": include_draft,
+            "include_private": include_private,
+            "ignore_local_resources": ignore_local_resources,
+            **_max_age_params(max_age),
+            "due": due,
+            "shard": "{}/{}".format(*shard) if shard else None,
+        },
+        resume,
+    )
+    if not (max_age or due):
+        q = _continue_run(q, model.Package.id, run)
+
+    stats = Counter(run.stats)
+    with click.progressbar(_stream(q), length=_count(q)) as bar:
+        for buff, result in processor.process(
+                bar,
+                chunk,
+                lambda buff: {
                     "fq": "id:({})".format(" OR ".join(p.id for p in buff)),
                     "save": True,
                     "clear_available": False,
@@ -273,9 +828,14 @@ def check_applications(
                     "include_private": include_private,
                     "skip_invalid": True,
                     "rows": chunk,
-                    "link_patch": {"delay": delay, "timeout": timeout},
+                    "keyset": True,
+                    "link_patch": {"timeout": timeout},
+                    **_scheduler_params(delay, host_concurrency),
+                    **_max_age_params(max_age),
+                    "due_only": due,
                 },
-            )
+        ):
+            _write_results(output, result)
             stats.update(r["state"] for r in result)
             overview = (
                 ", ".join(
@@ -286,18 +846,29 @@ def check_applications(
                 or "not available"
             )
             bar.label = f"Overview: {overview}"
+            _advance_run(run, buff[-1].id, len(buff), stats)
 
     # tk.get_action("check_link_email_report")({},{})
 
+    _finish_run(run)
+    context["check_link_engine"].close()
     click.secho("Done", fg="green")
+    _echo_memo_stats(processor.unique, processor.hits, processor.skipped)
 
-    _purge_stale_applications( start_time )
+    # reports skipped because of max-age or schedule are still valid. When
+    # run is resumed, part of the reports was updated before this process
+    # started
+    if not due:
+        start_time = min(start_time, run.started)
+        _purge_stale_applications( start_time - max_age if max_age else start_time )
 
 
 @check_link.command()
 @click.argument('older_than', type=Date())
-def purge_stale_applications( older_than ):
-    _purge_stale_applications( older_than )
+@batch_size_option
+@dry_run_option
+def purge_stale_applications( older_than, batch_size: int, dry_run: bool ):
+    _purge_stale_applications( older_than, batch_size, dry_run )
 
 def _take(seq: Iterable[T], size: int) -> list[T]:
     return list(islice(seq, size))
@@ -305,7 +876,34 @@ def _take(seq: Iterable[T], size: int) -> list[T]:
 
 @check_link.command()
 @click.option(
-    "-d", "--delay", default=0, help="Delay between requests", type=click.FloatRange(0)
+    "-c",
+    "--chunk",
+    help="Number of resources that processed simultaneously",
+    default=1,
+    type=click.IntRange(
+        1,
+    ),
+)
+@click.option(
+    "-n",
+    "--concurrency",
+    help="Maximum number of requests in flight. Defaults to the chunk size",
+    type=click.IntRange(
+        1,
+    ),
+)
+@click.option(
+    "-d",
+    "--delay",
+    default=0,
+    help="Minimal interval between requests to the same host",
+    type=click.FloatRange(0),
+)
+@click.option(
+    "--host-concurrency",
+    default=0,
+    help="Maximum number of simultaneous requests to the same host",
+    type=click.IntRange(0),
 )
 @click.option(
     "-t", "--timeout", default=60, help="Request timeout", type=click.FloatRange(0)
@@ -313,8 +911,19 @@ def _take(seq: Iterable[T], size: int) -> list[T]:
 @click.option(
     "-i", "--ignore-local-resources", is_flag=True, help="Do not check resources hosted locally"
 )
+@max_age_option
+@due_option
+@resume_option
+@output_option
+@metrics_file_option
+@profile_option
 @click.argument("ids", nargs=-1)
-def check_resources(ids: tuple[str, ...], delay: float, timeout: float, ignore_local_resources: bool, ):
+def check_resources(
+        ids: tuple[str, ...], chunk: int, concurrency: Optional[int], delay: float,
+        host_concurrency: int, timeout: float, ignore_local_resources: bool,
+        max_age: Optional[timedelta], due: bool, resume: bool,
+        output: Optional[IO[str]],
+):
     """Check every resource on the portal.
 
     Scope can be narrowed via arbitary number of arguments, specifying
@@ -324,10 +933,19 @@ def check_resources(ids: tuple[str, ...], delay: float, timeout: float, ignore_l
     site_url = tk.config.get('ckan.site_url')
 
     user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
-    context = {"user": user["name"]}
-
-    check = tk.get_action("check_link_resource_check")
-    q = model.Session.query(model.Resource.id,model.Resource.name,model.Resource.url).filter_by(state="active")
+    memo = CheckMemo()
+    context = {
+        "user": user["name"],
+        "check_link_memo": memo,
+        "check_link_engine": make_engine(),
+    }
+
+    q = model.Session.query(
+        model.Resource.id,
+        model.Resource.url,
+        model.Resource.url_type,
+        model.Resource.package_id,
+    ).filter_by(state="active")
 
     if ids:
         q = q.filter(model.Resource.id.in_(ids))
@@ -341,52 +959,118 @@ def check_resources(ids: tuple[str, ...], delay: float, timeout: float, ignore_l
 
     q = q.filter(model.Resource.url.notlike("http://_datastore_only_resource%"))
 
-    stats = Counter()
-    total = q.count()
-    overview = "Not ready yet"
-    results = []
+    if max_age or due:
+        q = _filter_reports(
+            q.outerjoin(Report, Report.resource_id == model.Resource.id), max_age, due
+        )
 
-    log.info( 'RESOURCE URLS TO CHECK:')
-    for r in q:
-        log.info("{name} : {url}".format(name=r.name or 'Unknown',url=r.url or 'Unknown'))
+    run = _start_run(
+        "check-resources",
+        {
+            "ids": sorted(ids),
+            "ignore_local_resources": ignore_local_resources,
+            **_max_age_params(max_age),
+            "due": due,
+        },
+        resume,
+    )
+    if not (max_age or due):
+        q = _continue_run(q, model.Resource.id, run)
+
+    stats = Counter(run.stats)
+    total = _count(q)
+    overview = "Not ready yet"
 
-    with click.progressbar(q, length=total) as bar:
-        for res in bar:
-            bar.label = f"Current: {res.id}. Overview({total} total): {overview}"
-            try:
-                result = check(
-                    context.copy(),
+    try:
+        with click.progressbar(_stream(q), length=total) as bar:
+            bar.label = f"Overview({total} total): {overview}"
+            while True:
+                buff = _take(bar, chunk)
+                if not buff:
+                    break
+
+                result = _check_resources(
+                    context,
+                    buff,
                     {
-                        "save": True,
-                        "clear_available": False,
-                        "id": res.id,
-                        "link_patch": {"delay": delay, "timeout": timeout},
+                        "link_patch": {"timeout": timeout},
+                        "concurrency": concurrency or chunk,
+                        **_scheduler_params(delay, host_concurrency),
                     },
                 )
-            except tk.ValidationError as e:
-                log.error("Cannot check %s: %s", res.id, e)
-                result = {"state": "exception"}
-
-            results.append( result )
-
-            stats[result["state"]] += 1
-            overview = (
-                ", ".join(
-                    f"{click.style(k,  underline=True)}:"
-                    f" {click.style(str(v),bold=True)}"
-                    for k, v in stats.items()
+                _write_results(output, result)
+
+                stats.update(r["state"] for r in result)
+                overview = (
+                    ", ".join(
+                        f"{click.style(k,  underline=True)}:"
+                        f" {click.style(str(v),bold=True)}"
+                        for k, v in stats.items()
+                    )
+                    or "not available"
                 )
-                or "not available"
-            )
-            bar.label = f"Current: {res.id}. Overview({total} total): {overview}"
+                bar.label = f"Overview({total} total): {overview}"
+                _advance_run(run, buff[-1].id, len(buff), stats)
+
+        _finish_run(run)
+    finally:
+        context["check_link_engine"].close()
 
     click.secho("Done", fg="green")
+    _echo_memo_stats(len(memo), memo.hits, memo.skipped)
 
     # tk.get_action("check_link_email_report")({},{})
 
+
+def _check_resources(
+    context: dict[str, Any], resources: list[Any], params: dict[str, Any]
+) -> list[dict[str, Any]]:
+    """Check a batch of resources with a single request and save results.
+
+    Every item of `resources` must have `id`, `package_id`, `url` and
+    `url_type` attributes. Uploaded resources are checked using their
+    download URL.
+
+    """
+    urls = {
+        res.id: resource_url(res.id, res.package_id, res.url, res.url_type)
+        for res in resources
+    }
+    reports = tk.get_action("check_link_url_check")(
+        context.copy(),
+        dict(
+            params,
+            url=list(dict.fromkeys(url for url in urls.values() if url)),
+            skip_invalid=True,
+        ),
+    )
+    by_url = {report["url"]: report for report in reports}
+
+    results = []
+    for res in resources:
+        url = urls[res.id]
+        if url not in by_url:
+            log.error("Cannot check %s: invalid URL %s", res.id, url)
+            results.append({"state": "exception", "resource_id": res.id})
+            continue
+
+        results.append(
+            dict(by_url[url], resource_id=res.id, package_id=res.package_id)
+        )
+
+    with metrics.phase("save"):
+        tk.get_action("check_link_report_save_many")(
+            context.copy(),
+            {"reports": [r for r in results if r["state"] != "exception"]},
+        )
+    return results
+
+
 @check_link.command()
 @click.option("-o", "--orphans-only", is_flag=True, help="Only drop reports for resources that point to a nonexistent dataset")
-def purge_reports(orphans_only: bool):
+@batch_size_option
+@dry_run_option
+def purge_reports(orphans_only: bool, batch_size: int, dry_run: bool):
     """Purge check-link reports.
     """
     q = model.Session.query(Report)
@@ -397,24 +1081,26 @@ def purge_reports(orphans_only: bool):
             model.Resource.id.is_(None) | (model.Resource.state != "active")
         )
 
-    if q.count() == 0:
-        if orphans_only:
-            log.info( 'No orphaned check_link resource records found.' )
-        else:
-            log.info( 'No check_link resource records found.' )
+    total = _delete_reports(q, batch_size, dry_run)
+    kind = "orphaned check_link resource" if orphans_only else "check_link resource"
+
+    if total == 0:
+        log.info( 'No {} records found.'.format( kind ) )
+    elif dry_run:
+        log.info( '{} {} records would be deleted.'.format( total, kind ) )
     else:
-        if orphans_only:
-            log.info( '{} orphaned check_link resource records found.'.format( q.count() ) )
-        else:
-            log.info( '{} check_link resource records found.'.format( q.count() ) )
-        user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
-        context = {"user": user["name"]}
-
-        action = tk.get_action("check_link_report_delete")
-        with click.progressbar(q, length=q.count()) as bar:
-            for report in bar:
-                log.info( 'Deleting check_link record for resource {}'.format( report.resource_id ) )
-                action(context.copy(), {"id": report.id})
+        log.info( '{} {} records deleted.'.format( total, kind ) )
+
+@check_link.command()
+def prune_history():
+    """Remove check history older than the configured retention period.
+    """
+    user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    result = tk.get_action("check_link_history_prune")({"user": user["name"]}, {})
+
+    for kind, count in result.items():
+        click.echo(f"Deleted {kind}: {click.style(str(count), bold=True)}")
+
 
 @check_link.command()
 @click.pass_context
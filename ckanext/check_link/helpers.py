@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+import ckan.model as model
+
+from .utils import TTLCache
+
+_titles: TTLCache[str] = TTLCache(maxsize=1024, ttl=300)
+
+
+def get_package_title(package_id: str) -> str:
+    """Return the title of the package with the given ID"""
+    return get_package_titles([package_id]).get(package_id, "")
+
+
+def get_package_titles(package_ids: Iterable[str]) -> dict[str, str]:
+    """Return titles of packages with the given IDs.
+
+    Titles that are not cached yet are fetched with a single query.
+
+    """
+    titles: dict[str, str] = {}
+    missing: set[str] = set()
+
+    for id_ in package_ids:
+        if not id_:
+            continue
+
+        title = _titles.get(id_)
+        if title is None:
+            missing.add(id_)
+        else:
+            titles[id_] = title
+
+    if missing:
+        q = model.Session.query(model.Package.id, model.Package.title).filter(
+            model.Package.id.in_(missing)
+        )
+        for id_, title in q:
+            titles[id_] = title or ""
+            _titles.set(id_, titles[id_])
+
+    return titles
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import ckan.plugins.toolkit as tk
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+from .checker import Link
+from .model import STATE_CODES, History, Host, HostRollup, LinkRollup, TrackedUrl
+
+CONFIG_ENABLED = "ckanext.check_link.history.enabled"
+DEFAULT_ENABLED = False
+
+CONFIG_RETENTION = "ckanext.check_link.history.retention"
+DEFAULT_RETENTION = 30
+
+CONFIG_ROLLUP_RETENTION = "ckanext.check_link.history.rollup_retention"
+DEFAULT_ROLLUP_RETENTION = 400
+
+
+def is_enabled() -> bool:
+    return tk.asbool(tk.config.get(CONFIG_ENABLED, DEFAULT_ENABLED))
+
+
+def retention() -> tuple[timedelta, timedelta]:
+    """How long raw history and daily rollups are kept."""
+    return (
+        timedelta(days=tk.asint(tk.config.get(CONFIG_RETENTION, DEFAULT_RETENTION))),
+        timedelta(
+            days=tk.asint(
+                tk.config.get(CONFIG_ROLLUP_RETENTION, DEFAULT_ROLLUP_RETENTION)
+            )
+        ),
+    )
+
+
+def record(sess: Any, links: dict[str, Link], checked_at: datetime):
+    """Append results of checks to history and update daily rollups.
+
+    `links` maps normalized URL to the checked link.
+
+    """
+    if not links:
+        return
+
+    hosts = _host_ids(sess, {_host(url) for url in links})
+    urls = _url_ids(sess, {url: hosts[_host(url)] for url in links})
+
+    rows: dict[int, dict[str, Any]] = {}
+    for url, link in links.items():
+        rows[urls[url]] = {
+            "url_id": urls[url],
+            "checked_at": checked_at,
+            "state": STATE_CODES.get(link.state.name, 0),
+            "code": link.code,
+            "latency": None if link.elapsed is None else round(link.elapsed * 1000),
+        }
+
+    # rows that already exist, e.g. when the save is retried, are skipped
+    # and must not be counted by rollups again
+    inserted = sess.execute(
+        insert(History.__table__)
+        .values(list(rows.values()))
+        .on_conflict_do_nothing()
+        .returning(History.__table__.c.url_id)
+    )
+
+    by_link: dict[int, list[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    by_host: dict[int, list[int]] = defaultdict(lambda: [0, 0, 0, 0])
+    host_ids = {urls[url]: hosts[_host(url)] for url in links}
+
+    for (url_id,) in inserted:
+        row = rows[url_id]
+        for totals in [by_link[url_id], by_host[host_ids[url_id]]]:
+            totals[0] += 1
+            totals[1] += row["state"] == STATE_CODES["available"]
+            if row["latency"] is not None:
+                totals[2] += row["latency"]
+                totals[3] += 1
+
+    if not by_link:
+        return
+
+    day = checked_at.date()
+    _rollup(sess, LinkRollup.__table__, "url_id", by_link, day)
+    _rollup(sess, HostRollup.__table__, "host_id", by_host, day)
+
+
+def prune(sess: Any, now: datetime) -> dict[str, int]:
+    """Remove history and rollups that are older than retention period.
+
+    URLs and hosts that are no longer referenced by remaining history or
+    rollups are removed as well.
+
+    """
+    raw, rollup = retention()
+    cutoff = (now - rollup).date()
+
+    result = {
+        "history": sess.query(History)
+        .filter(History.checked_at < now - raw)
+        .delete(synchronize_session=False),
+        "link_rollups": sess.query(LinkRollup)
+        .filter(LinkRollup.day < cutoff)
+        .delete(synchronize_session=False),
+        "host_rollups": sess.query(HostRollup)
+        .filter(HostRollup.day < cutoff)
+        .delete(synchronize_session=False),
+    }
+
+    result["urls"] = (
+        sess.query(TrackedUrl)
+        .filter(
+            ~sa.exists().where(History.url_id == TrackedUrl.id),
+            ~sa.exists().where(LinkRollup.url_id == TrackedUrl.id),
+        )
+        .delete(synchronize_session=False)
+    )
+    result["hosts"] = (
+        sess.query(Host)
+        .filter(
+            ~sa.exists().where(TrackedUrl.host_id == Host.id),
+            ~sa.exists().where(HostRollup.host_id == Host.id),
+        )
+        .delete(synchronize_session=False)
+    )
+
+    return result
+
+
+def uptime(
+    sess: Any, since: date, url_id: Optional[int] = None, host_id: Optional[int] = None
+) -> list[dict[str, Any]]:
+    """Daily rollups of the URL or host, starting from `since`."""
+    if url_id is not None:
+        table, condition = LinkRollup, LinkRollup.url_id == url_id
+    else:
+        table, condition = HostRollup, HostRollup.host_id == host_id
+
+    q = (
+        sess.query(
+            table.day,
+            table.checks,
+            table.available,
+            table.latency_total,
+            table.latency_checks,
+        )
+        .filter(condition, table.day >= since)
+        .order_by(table.day)
+    )
+
+    return [
+        {
+            "day": row.day.isoformat(),
+            "checks": row.checks,
+            "available": row.available,
+            "uptime": row.available / row.checks if row.checks else None,
+            "latency": (
+                row.latency_total / row.latency_checks if row.latency_checks else None
+            ),
+        }
+        for row in q
+    ]
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+def _host_ids(sess: Any, names: set[str]) -> dict[str, int]:
+    sess.execute(
+        insert(Host.__table__)
+        .values([{"name": name} for name in names])
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    return dict(sess.query(Host.name, Host.id).filter(Host.name.in_(names)))
+
+
+def _url_ids(sess: Any, hosts: dict[str, int]) -> dict[str, int]:
+    sess.execute(
+        insert(TrackedUrl.__table__)
+        .values([{"url": url, "host_id": host} for url, host in hosts.items()])
+        .on_conflict_do_nothing(index_elements=["url"])
+    )
+    return dict(
+        sess.query(TrackedUrl.url, TrackedUrl.id).filter(TrackedUrl.url.in_(hosts))
+    )
+
+
+def _rollup(
+    sess: Any, table: sa.Table, key: str, totals: dict[int, list[int]], day: date
+):
+    stmt = insert(table).values(
+        [
+            {
+                key: id_,
+                "day": day,
+                "checks": checks,
+                "available": available,
+                "latency_total": latency_total,
+                "latency_checks": latency_checks,
+            }
+            for id_, (checks, available, latency_total, latency_checks) in totals.items()
+        ]
+    )
+    sess.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[key, "day"],
+            set_={
+                column: table.c[column] + stmt.excluded[column]
+                for column in ["checks", "available", "latency_total", "latency_checks"]
+            },
+        )
+    )
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from typing import Any, Optional
+
+import ckan.plugins.toolkit as tk
+from ckan import authz
+from ckan.lib import jobs
+from rq import get_current_job
+
+from .utils import CheckMemo
+
+log = logging.getLogger(__name__)
+
+CONFIG_BATCH_SIZE = "ckanext.check_link.job.batch_size"
+DEFAULT_BATCH_SIZE = 100
+
+CONFIG_MAX_RESULTS = "ckanext.check_link.job.max_results"
+DEFAULT_MAX_RESULTS = 1000
+
+CONFIG_TIMEOUT = "ckanext.check_link.job.timeout"
+DEFAULT_TIMEOUT = 3600
+
+CONFIG_RESULT_TTL = "ckanext.check_link.job.result_ttl"
+DEFAULT_RESULT_TTL = 86400
+
+
+def enqueue_check(action: str, context: dict[str, Any], data_dict: dict[str, Any]):
+    """Run the check action as a background job.
+
+    The job checks links in batches and keeps its progress in the job's
+    metadata, available via `check_link_job_status` action.
+
+    """
+    user = context.get("user")
+    job = tk.enqueue_job(
+        check,
+        [action, dict(data_dict, **{"async": False}), user],
+        title=f"{action} by {user or 'anonymous'}",
+        rq_kwargs={
+            "timeout": tk.asint(tk.config.get(CONFIG_TIMEOUT, DEFAULT_TIMEOUT)),
+            "result_ttl": tk.asint(
+                tk.config.get(CONFIG_RESULT_TTL, DEFAULT_RESULT_TTL)
+            ),
+            "meta": {
+                "check_link": {
+                    "user": user,
+                    "action": action,
+                    "processed": 0,
+                    "stats": {},
+                    "reports": [],
+                }
+            },
+        },
+    )
+
+    return {"job_id": job.id}
+
+
+def check(action: str, data_dict: dict[str, Any], user: str):
+    """Background job that checks links in batches."""
+    # avoid circular import: actions enqueue jobs from this module
+    from .logic.action.check import make_engine
+
+    engine = make_engine()
+    context: dict[str, Any] = {
+        "user": user,
+        "check_link_memo": CheckMemo(),
+        "check_link_engine": engine,
+    }
+    progress = _Progress()
+    size = tk.asint(tk.config.get(CONFIG_BATCH_SIZE, DEFAULT_BATCH_SIZE))
+
+    try:
+        if action == "check_link_url_check":
+            urls: list[str] = data_dict["url"]
+            progress.total = len(urls)
+            for start in range(0, len(urls), size):
+                batch = dict(data_dict, url=urls[start : start + size])
+                reports = tk.get_action(action)(context.copy(), batch)
+                progress.update(len(batch["url"]), reports)
+        else:
+            _check_search(action, data_dict, context, size, progress)
+    finally:
+        engine.close()
+
+    progress.finish()
+
+
+def _check_search(
+    action: str,
+    data_dict: dict[str, Any],
+    context: dict[str, Any],
+    size: int,
+    progress: _Progress,
+):
+    """Check requested packages in batches of `size`.
+
+    As in the synchronous call, only `rows` packages, starting from `start`
+    (or after `after` in keyset mode), are checked.
+
+    """
+    limit = data_dict["rows"]
+    params = dict(data_dict)
+    processed = 0
+
+    while processed < limit:
+        rows = min(size, limit - processed)
+        ctx = context.copy()
+        reports = tk.get_action(action)(ctx, dict(params, rows=rows))
+
+        count = ctx.get("check_link_package_count", 0)
+        progress.update(count, reports)
+        processed += count
+        if count < rows:
+            break
+
+        if params["keyset"]:
+            params["after"] = ctx["check_link_last_package"]
+        else:
+            params["start"] += count
+
+
+class _Progress:
+    """Progress of the current job stored in its metadata."""
+
+    def __init__(self):
+        self.job = get_current_job()
+        self.total = None
+        self.processed = 0
+        self.stats: Counter[str] = Counter()
+        self.reports: list[dict[str, Any]] = []
+        self.max_results = tk.asint(
+            tk.config.get(CONFIG_MAX_RESULTS, DEFAULT_MAX_RESULTS)
+        )
+
+    def update(self, processed: int, reports: list[dict[str, Any]]):
+        self.processed += processed
+        self.stats.update(r["state"] for r in reports)
+        self.reports.extend(reports[: self.max_results - len(self.reports)])
+        self._save()
+
+    def finish(self):
+        self._save(finished=True)
+
+    def _save(self, finished: bool = False):
+        if not self.job:
+            return
+
+        self.job.meta["check_link"] = dict(
+            self.job.meta.get("check_link", {}),
+            total=self.total,
+            processed=self.processed,
+            stats=dict(self.stats),
+            reports=self.reports,
+            finished=finished,
+        )
+        self.job.save_meta()
+
+
+def status(job_id: str, user: Optional[str]) -> dict[str, Any]:
+    """Progress and partial results of the check job."""
+    try:
+        job = jobs.job_from_id(job_id)
+    except KeyError:
+        raise tk.ObjectNotFound("Job not found")
+
+    meta = job.meta.get("check_link")
+    if meta is None:
+        raise tk.ObjectNotFound("Job not found")
+
+    if meta["user"] != user and not authz.is_sysadmin(user):
+        raise tk.NotAuthorized("Job was started by a different user")
+
+    state = job.get_status()
+    error = None
+    if job.is_failed and job.exc_info:
+        error = job.exc_info.strip().splitlines()[-1]
+
+    return dict(
+        meta,
+        id=job.id,
+        status=getattr(state, "value", state),
+        error=error,
+    )
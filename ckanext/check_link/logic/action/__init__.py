@@ -1,8 +1,9 @@
-from . import check, report
+from . import check, history, report
 
 
 def get_actions():
     return {
         **check.get_actions(),
         **report.get_actions(),
+        **history.get_actions(),
     }
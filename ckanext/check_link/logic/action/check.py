@@ -1,20 +1,60 @@
 from __future__ import annotations
 import logging
+from datetime import datetime, timedelta
+from functools import partial
 from itertools import islice
-from typing import Any, Iterable
+from typing import Any, Iterable, Optional
 
+import ckan.model as model
 import ckan.plugins.toolkit as tk
-from check_link import Link, check_all
 from ckan.lib.search.query import solr_literal
 from ckan.logic import validate
 
 from ckanext.toolbelt.decorators import Collector
 
+from ckanext.check_link import history, jobs, metrics
+from ckanext.check_link.checker import (
+    AsyncEngine,
+    BasicEngine,
+    Checker,
+    Engine,
+    Link,
+)
+from ckanext.check_link.model import Report
+from ckanext.check_link.utils import CheckMemo, normalize_url, resource_url
+
 from .. import schema
 
 CONFIG_TIMEOUT = "ckanext.check_link.check.timeout"
 DEFAULT_TIMEOUT = 10
 
+CONFIG_CONCURRENCY = "ckanext.check_link.check.concurrency"
+DEFAULT_CONCURRENCY = 0
+
+CONFIG_HOST_CONCURRENCY = "ckanext.check_link.check.host_concurrency"
+DEFAULT_HOST_CONCURRENCY = 0
+
+CONFIG_HOST_INTERVAL = "ckanext.check_link.check.host_interval"
+DEFAULT_HOST_INTERVAL = 0
+
+CONFIG_CONDITIONAL = "ckanext.check_link.check.conditional"
+DEFAULT_CONDITIONAL = True
+
+CONFIG_ENGINE = "ckanext.check_link.check.engine"
+DEFAULT_ENGINE = "basic"
+
+CONFIG_MAX_CONNECTIONS = "ckanext.check_link.check.max_connections"
+DEFAULT_MAX_CONNECTIONS = 100
+
+CONFIG_MAX_KEEPALIVE = "ckanext.check_link.check.max_keepalive"
+DEFAULT_MAX_KEEPALIVE = 20
+
+# parameters of url_check that are passed through by other check actions
+SCHEDULER_PARAMS = ("concurrency", "host_concurrency", "host_interval")
+
+# maximal number of packages requested from package_search at once
+SEARCH_PAGE_SIZE = 1000
+
 log = logging.getLogger(__name__)
 action, get_actions = Collector("check_link").split()
 
@@ -23,38 +63,234 @@ action, get_actions = Collector("check_link").split()
 @validate(schema.url_check)
 def url_check(context, data_dict):
     tk.check_access("check_link_url_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_url_check", context, data_dict)
+
     timeout: int = tk.asint(tk.config.get(CONFIG_TIMEOUT, DEFAULT_TIMEOUT))
-    links: list[Link] = []
+    checker_factory = partial(
+        Checker,
+        concurrency=data_dict.get(
+            "concurrency",
+            tk.asint(tk.config.get(CONFIG_CONCURRENCY, DEFAULT_CONCURRENCY)),
+        ),
+        host_concurrency=data_dict.get(
+            "host_concurrency",
+            tk.asint(
+                tk.config.get(CONFIG_HOST_CONCURRENCY, DEFAULT_HOST_CONCURRENCY)
+            ),
+        ),
+        host_interval=data_dict.get(
+            "host_interval",
+            float(tk.config.get(CONFIG_HOST_INTERVAL, DEFAULT_HOST_INTERVAL)),
+        ),
+    )
+    memo: Optional[CheckMemo] = context.get("check_link_memo")
+
+    fresh: dict[str, dict[str, Any]] = {}
+    if "max_age" in data_dict:
+        fresh = _fresh_reports(context, data_dict["url"], data_dict["max_age"])
+
+    links: dict[str, Link] = {}
+    keys: list[tuple[str, str]] = []
 
     kwargs: dict[str, Any] = data_dict["link_patch"]
     kwargs.setdefault("timeout", timeout)
 
     for url in data_dict["url"]:
-        try:
-            links.append(Link(url, **kwargs))
-        except ValueError as e:
-            if data_dict["skip_invalid"]:
-                log.debug("Skipping invalid url: %s", url)
-            else:
+        key = normalize_url(url)
+        if (
+            key not in links
+            and key not in fresh
+            and (memo is None or key not in memo)
+        ):
+            try:
+                links[key] = Link(url, **kwargs)
+            except ValueError as e:
+                if data_dict["skip_invalid"]:
+                    log.debug("Skipping invalid url: %s", url)
+                    continue
                 raise tk.ValidationError({"url": ["Must be a valid URL"]}) from e
 
-    reports = [
-        {
-            "url": link.link,
-            "state": link.state.name,
-            "code": link.code,
-            "reason": link.reason,
-            "explanation": link.details,
-        }
-        for link in check_all(links)
-    ]
+        keys.append((url, key))
+
+    conditional: bool = data_dict.get(
+        "conditional",
+        tk.asbool(tk.config.get(CONFIG_CONDITIONAL, DEFAULT_CONDITIONAL)),
+    )
+    if conditional:
+        _apply_validators(context, links.values())
+
+    engine: Optional[Engine] = context.get("check_link_engine")
+    own_engine = engine is None
+    if engine is None:
+        engine = make_engine()
+
+    try:
+        with metrics.phase("http"):
+            checked_links = dict(
+                zip(links, engine.check(list(links.values()), checker_factory))
+            )
+    finally:
+        if own_engine:
+            engine.close()
+    checked: dict[str, dict[str, Any]] = {
+        key: _link_report(link) for key, link in checked_links.items()
+    }
+
+    if history.is_enabled():
+        history.record(context["session"], checked_links, datetime.utcnow())
+
+    results = dict(fresh, **checked)
+    if memo is not None:
+        reused = sum(1 for _url, key in keys if key not in fresh)
+        memo.hits += reused - len(checked)
+        memo.skipped += len(keys) - reused
+        for key, report in checked.items():
+            memo.add(key, report)
+        results = {key: results.get(key) or memo.get(key) for _url, key in keys}
+
+    reports = [dict(results[key], url=url) for url, key in keys]
 
     if data_dict["save"]:
-        _save_reports(context, reports, data_dict["clear_available"])
+        _save_reports(
+            context,
+            [r for r, (_url, key) in zip(reports, keys) if key not in fresh],
+            data_dict["clear_available"],
+        )
+
+    if history.is_enabled() and not context.get("defer_commit"):
+        context["session"].commit()
 
     return reports
 
 
+def make_engine() -> Engine:
+    """Create the engine configured for the portal.
+
+    Put the engine into the action context under `check_link_engine` key to
+    share it between multiple calls of `check_link_url_check`. In this case
+    the caller is responsible for closing the engine.
+
+    """
+    name = tk.config.get(CONFIG_ENGINE, DEFAULT_ENGINE)
+    if name == "basic":
+        return BasicEngine()
+
+    if name == "async":
+        return AsyncEngine(
+            tk.asint(tk.config.get(CONFIG_MAX_CONNECTIONS, DEFAULT_MAX_CONNECTIONS)),
+            tk.asint(tk.config.get(CONFIG_MAX_KEEPALIVE, DEFAULT_MAX_KEEPALIVE)),
+        )
+
+    raise ValueError(f"Unsupported value of {CONFIG_ENGINE}: {name}")
+
+
+def _link_report(link: Link) -> dict[str, Any]:
+    report: dict[str, Any] = {
+        "state": link.state.name,
+        "code": link.code,
+        "reason": link.reason,
+        "explanation": link.details,
+    }
+
+    # validators are stored inside report details and used by the next check
+    if link.etag:
+        report["etag"] = link.etag
+
+    if link.last_modified:
+        report["last_modified"] = link.last_modified
+
+    return report
+
+
+def _stored_report(report: Report) -> dict[str, Any]:
+    """Restore result of the check from the saved report."""
+    result = {
+        "state": report.state,
+        "code": report.details.get("code"),
+        "reason": report.details.get("reason"),
+        "explanation": report.details.get("explanation"),
+    }
+    for field in ("etag", "last_modified"):
+        if report.details.get(field):
+            result[field] = report.details[field]
+
+    return result
+
+
+def _fresh_reports(
+    context, urls: Iterable[str], max_age: int
+) -> dict[str, dict[str, Any]]:
+    """Results of the checks performed during the last `max_age` seconds."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+    q = (
+        context["session"]
+        .query(Report)
+        .filter(Report.url.in_(set(urls)), Report.last_checked >= cutoff)
+        .order_by(Report.url, Report.last_checked.desc())
+        .distinct(Report.url)
+    )
+
+    return {normalize_url(report.url): _stored_report(report) for report in q}
+
+
+def _skip_reports(
+    context, pairs: list[tuple[dict[str, Any], str]], condition: Any
+) -> list[tuple[dict[str, Any], str]]:
+    """Drop resources and applications whose report matches the condition."""
+    sess = context["session"]
+
+    resources = {p["resource_id"] for p, _url in pairs if "resource_id" in p}
+    urls = {url for patch, url in pairs if "resource_id" not in patch}
+
+    skipped_resources: set[str] = set()
+    if resources:
+        q = sess.query(Report.resource_id).filter(
+            Report.resource_id.in_(resources), condition
+        )
+        skipped_resources.update(id_ for id_, in q)
+
+    skipped_urls: set[str] = set()
+    if urls:
+        q = sess.query(Report.url).filter(
+            Report.resource_id.is_(None), Report.url.in_(urls), condition
+        )
+        skipped_urls.update(url for url, in q)
+
+    return [
+        (patch, url)
+        for patch, url in pairs
+        if (
+            patch["resource_id"] not in skipped_resources
+            if "resource_id" in patch
+            else url not in skipped_urls
+        )
+    ]
+
+
+def _apply_validators(context, links: Iterable[Link]):
+    """Turn checks into conditional requests using previously saved reports."""
+    by_url = {link.link: link for link in links}
+    if not by_url:
+        return
+
+    details = Report.details
+    q = (
+        context["session"]
+        .query(Report.url, details["etag"].astext, details["last_modified"].astext)
+        .filter(
+            Report.url.in_(by_url),
+            details.has_key("etag") | details.has_key("last_modified"),
+        )
+        # several reports may share the URL; the newest validators win
+        .distinct(Report.url)
+        .order_by(Report.url, Report.last_checked.desc())
+    )
+
+    for url, etag, last_modified in q:
+        by_url[url].use_validators(etag, last_modified)
+
+
 @action
 @validate(schema.resource_check)
 def resource_check(context, data_dict):
@@ -79,6 +315,9 @@ def resource_check(context, data_dict):
 @validate(schema.package_check)
 def package_check(context, data_dict):
     tk.check_access("check_link_package_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_package_check", context, data_dict)
+
     return _search_check(
         context,
         "res_url:* (id:{0} OR name:{0})".format(solr_literal(data_dict["id"])),
@@ -90,6 +329,8 @@ def package_check(context, data_dict):
 @validate(schema.organization_check)
 def organization_check(context, data_dict):
     tk.check_access("check_link_organization_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_organization_check", context, data_dict)
 
     return _search_check(
         context,
@@ -102,6 +343,8 @@ def organization_check(context, data_dict):
 @validate(schema.group_check)
 def group_check(context, data_dict):
     tk.check_access("check_link_group_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_group_check", context, data_dict)
 
     return _search_check(
         context, "res_url:* groups:{}".format(solr_literal(data_dict["id"])), data_dict
@@ -112,6 +355,8 @@ def group_check(context, data_dict):
 @validate(schema.user_check)
 def user_check(context, data_dict):
     tk.check_access("check_link_user_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_user_check", context, data_dict)
 
     return _search_check(
         context,
@@ -124,86 +369,152 @@ def user_check(context, data_dict):
 @validate(schema.search_check)
 def search_check(context, data_dict):
     tk.check_access("check_link_search_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_search_check", context, data_dict)
 
     return _search_check(context, data_dict["fq"], data_dict)["reports"]
 
 
 def _search_check(context, fq: str, data_dict: dict[str, Any]):
-    params = {
-        "fq": fq,
-        "start": data_dict["start"],
-        "include_drafts": data_dict["include_drafts"],
-        # "include_deleted": data_dict["include_deleted"],
-        "include_private": data_dict["include_private"],
-    }
-
     pairs = [
         ({"resource_id": res["id"], "package_id": pkg["id"]}, res["url"])
-        for pkg in islice(_iterate_search(context, params), data_dict["rows"])
+        for pkg in _search_packages(context, fq, data_dict)
         for res in pkg["resources"]
         if res["url"]
     ]
 
-    if not pairs:
-        return {"reports": []}
-
-    patches, urls = zip(*pairs)
-
-    result = tk.get_action("check_link_url_check")(
-        context,
-        {
-            "url": urls,
-            "skip_invalid": data_dict["skip_invalid"],
-            "link_patch": data_dict["link_patch"],
-        },
-    )
-
-    reports = [dict(report, **patch) for patch, report in zip(patches, result)]
-    if data_dict["save"]:
-        _save_reports(context, reports, data_dict["clear_available"])
-
-    return {
-        "reports": reports,
-    }
+    return _check_pairs(context, pairs, data_dict)
 
 @action
 @validate(schema.search_check)
 def application_check(context, data_dict):
     tk.check_access("check_link_application_check", context, data_dict)
+    if data_dict["async"]:
+        return jobs.enqueue_check("check_link_application_check", context, data_dict)
 
     return _application_check(context, data_dict["fq"], data_dict)["reports"]
 
 
-def _application_check(context, fq: str, data_dict: dict[str, Any]):
-    params = {
-        "fq": fq,
-        "start": data_dict["start"],
-        "include_drafts": data_dict["include_drafts"],
-        # "include_deleted": data_dict["include_deleted"],
-        "include_private": data_dict["include_private"],
-    }
+@action
+@validate(schema.db_check)
+def db_check(context, data_dict):
+    """Check resources selected directly from DB.
+
+    Resources are selected by IDs of their packages(`ids`) and/or by their
+    own IDs(`resource_ids`).
+
+    Unlike `search_check`, resources are not fetched via `package_search`,
+    so neither Solr query nor dictization of packages is involved.
+
+    """
+    tk.check_access("check_link_db_check", context, data_dict)
+
+    if "ids" not in data_dict and "resource_ids" not in data_dict:
+        raise tk.ValidationError(
+            {"ids": ["Either `ids` or `resource_ids` must be specified"]}
+        )
 
+    pairs = [
+        (
+            {"resource_id": resource_id, "package_id": package_id},
+            resource_url(resource_id, package_id, url, url_type),
+        )
+        for resource_id, package_id, url, url_type in _iterate_db(context, data_dict)
+    ]
+
+    return _check_pairs(context, pairs, data_dict)["reports"]
+
+
+def _iterate_db(context, data_dict: dict[str, Any]):
+    """Yield `(resource_id, package_id, url, url_type)` of every matching resource."""
+    states = ["active"]
+    if data_dict["include_drafts"]:
+        states.append("draft")
+
+    q = (
+        context["session"]
+        .query(
+            model.Resource.id,
+            model.Resource.package_id,
+            model.Resource.url,
+            model.Resource.url_type,
+        )
+        .join(model.Package, model.Package.id == model.Resource.package_id)
+        .filter(
+            model.Resource.state == "active",
+            model.Resource.url != "",
+            model.Package.state.in_(states),
+        )
+    )
+
+    if "ids" in data_dict:
+        q = q.filter(
+            model.Package.id.in_(data_dict["ids"])
+            | model.Package.name.in_(data_dict["ids"])
+        )
+
+    if "resource_ids" in data_dict:
+        q = q.filter(model.Resource.id.in_(data_dict["resource_ids"]))
+
+    if not data_dict["include_private"]:
+        q = q.filter(model.Package.private == False)  # noqa: E712
+
+    if "type" in data_dict:
+        q = q.filter(model.Package.type.in_(data_dict["type"]))
+
+    yield from q.order_by(model.Package.id, model.Resource.position).yield_per(
+        1000
+    )
+
+
+@action
+@validate(schema.job_status)
+def job_status(context, data_dict):
+    """Progress and partial results of the check started with `async` flag."""
+    tk.check_access("check_link_job_status", context, data_dict)
+    return jobs.status(data_dict["id"], context.get("user"))
+
+
+def _application_check(context, fq: str, data_dict: dict[str, Any]):
     pairs = [
         ({"package_id": pkg["id"]}, pkg["url"])
-        for pkg in islice(_iterate_search(context, params), data_dict["rows"])
+        for pkg in _search_packages(context, fq, data_dict)
         if pkg["url"]
     ]
 
+    return _check_pairs(context, pairs, data_dict)
+
+
+def _check_pairs(
+    context, pairs: list[tuple[dict[str, Any], str]], data_dict: dict[str, Any]
+):
+    """Check every unique URL once and spread result among all the patches."""
+    if pairs and "max_age" in data_dict:
+        cutoff = datetime.utcnow() - timedelta(seconds=data_dict["max_age"])
+        pairs = _skip_reports(context, pairs, Report.last_checked >= cutoff)
+
+    if pairs and data_dict["due_only"]:
+        pairs = _skip_reports(
+            context, pairs, Report.next_check_at > datetime.utcnow()
+        )
+
     if not pairs:
         return {"reports": []}
 
-    patches, urls = zip(*pairs)
-
     result = tk.get_action("check_link_url_check")(
         context,
         {
-            "url": urls,
+            "url": list(dict.fromkeys(url for _patch, url in pairs)),
             "skip_invalid": data_dict["skip_invalid"],
             "link_patch": data_dict["link_patch"],
+            **{k: data_dict[k] for k in SCHEDULER_PARAMS if k in data_dict},
         },
     )
+    by_url = {report["url"]: report for report in result}
 
-    reports = [dict(report, **patch) for patch, report in zip(patches, result)]
+    reports = [
+        dict(by_url[url], **patch) for patch, url in pairs if url in by_url
+    ]
     if data_dict["save"]:
         _save_reports(context, reports, data_dict["clear_available"])
 
@@ -212,11 +523,37 @@ def _application_check(context, fq: str, data_dict: dict[str, Any]):
     }
 
 
+def _search_packages(context, fq: str, data_dict: dict[str, Any]):
+    """Yield up to `rows` packages matching the filter query."""
+    params: dict[str, Any] = {
+        "fq": fq,
+        "include_drafts": data_dict["include_drafts"],
+        # "include_deleted": data_dict["include_deleted"],
+        "include_private": data_dict["include_private"],
+    }
+
+    if data_dict["keyset"]:
+        params["rows"] = min(data_dict["rows"], SEARCH_PAGE_SIZE)
+        packages = _iterate_keyset(context, params, data_dict.get("after"))
+    else:
+        params["start"] = data_dict["start"]
+        packages = _iterate_search(context, params)
+
+    for pkg in islice(packages, data_dict["rows"]):
+        # background jobs continue the next batch after this package
+        context["check_link_last_package"] = pkg["id"]
+        context["check_link_package_count"] = (
+            context.get("check_link_package_count", 0) + 1
+        )
+        yield pkg
+
+
 def _iterate_search(context, params: dict[str, Any]):
     params.setdefault("start", 0)
 
     while True:
-        pack = tk.get_action("package_search")(context.copy(), params)
+        with metrics.phase("search"):
+            pack = tk.get_action("package_search")(context.copy(), params)
         if not pack["results"]:
             return
 
@@ -225,15 +562,35 @@ def _iterate_search(context, params: dict[str, Any]):
         params["start"] += len(pack["results"])
 
 
-def _save_reports(context, reports: Iterable[dict[str, Any]], clear: bool):
-    save = tk.get_action("check_link_report_save")
-    delete = tk.get_action("check_link_report_delete")
+def _iterate_keyset(context, params: dict[str, Any], after: Optional[str] = None):
+    """Iterate over search results sorted by ID.
 
-    for report in reports:
-        if clear and report["state"] == "available":
-            try:
-                delete(context.copy(), report)
-            except tk.ObjectNotFound:
-                pass
-        else:
-            save(context.copy(), report)
+    Every page continues after the ID of the last package from the previous
+    page instead of using `start` offset, so the cost of a page does not grow
+    with the depth and packages indexed during iteration do not shift
+    results.
+
+    """
+    params = dict(params, sort="id asc")
+    fq_list = list(params.pop("fq_list", []))
+
+    while True:
+        page = dict(params, fq_list=fq_list)
+        if after:
+            page["fq_list"] = fq_list + ["id:{{{} TO *]".format(solr_literal(after))]
+
+        with metrics.phase("search"):
+            pack = tk.get_action("package_search")(context.copy(), page)
+        if not pack["results"]:
+            return
+
+        yield from pack["results"]
+
+        after = pack["results"][-1]["id"]
+
+
+def _save_reports(context, reports: Iterable[dict[str, Any]], clear: bool):
+    with metrics.phase("save"):
+        tk.get_action("check_link_report_save_many")(
+            context.copy(), {"reports": list(reports), "clear_available": clear}
+        )
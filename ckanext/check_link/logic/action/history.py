@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import ckan.plugins.toolkit as tk
+from ckan.logic import validate
+
+from ckanext.toolbelt.decorators import Collector
+
+from ckanext.check_link import history
+from ckanext.check_link.model import Host, TrackedUrl
+from ckanext.check_link.utils import normalize_url
+
+from .. import schema
+
+action, get_actions = Collector("check_link").split()
+
+
+@action
+@validate(schema.history_prune)
+def history_prune(context, data_dict):
+    """Remove check history and daily rollups older than retention period.
+
+    URLs and hosts without remaining history or rollups are removed too.
+
+    """
+    tk.check_access("check_link_history_prune", context, data_dict)
+    sess = context["session"]
+
+    result = history.prune(sess, datetime.utcnow())
+    sess.commit()
+
+    return result
+
+
+@action
+@validate(schema.link_uptime)
+def link_uptime(context, data_dict):
+    """Uptime of the URL or host computed from daily rollups."""
+    tk.check_access("check_link_link_uptime", context, data_dict)
+    sess = context["session"]
+
+    if "url" in data_dict:
+        entity = (
+            sess.query(TrackedUrl)
+            .filter(TrackedUrl.url == normalize_url(data_dict["url"]))
+            .one_or_none()
+        )
+        params = {"url_id": entity.id if entity else None}
+    elif "host" in data_dict:
+        entity = sess.query(Host).filter(Host.name == data_dict["host"]).one_or_none()
+        params = {"host_id": entity.id if entity else None}
+    else:
+        raise tk.ValidationError({"url": ["Either `url` or `host` is required"]})
+
+    if not entity:
+        raise tk.ObjectNotFound("No history for the link")
+
+    since = (datetime.utcnow() - timedelta(days=data_dict["days"] - 1)).date()
+    days = history.uptime(sess, since, **params)
+
+    checks = sum(day["checks"] for day in days)
+    available = sum(day["available"] for day in days)
+
+    return {
+        "checks": checks,
+        "available": available,
+        "uptime": available / checks if checks else None,
+        "days": days,
+    }
@@ -1,26 +1,107 @@
 from __future__ import annotations
 
 import ckan.lib.helpers as h
+import ckan.model as model
 import ckan.plugins.toolkit as tk
+import sqlalchemy as sa
 from ckan.logic import validate
+from ckan.model.types import make_uuid
+from sqlalchemy.dialects.postgresql import insert
 
 from ckanext.check_link.model import Report
+from ckanext.check_link.utils import TTLCache
 from ckanext.toolbelt.decorators import Collector
 
 from .. import schema
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import IO, Any, Optional
 import logging
 
-from ckan.lib import mailer
+import csv
+import inspect
+import io
 import socket
-from markupsafe import escape
+import tempfile
+
+from ckan.lib import mailer
 from flask import render_template
 
+CONFIG_MIN_INTERVAL = "ckanext.check_link.schedule.min_interval"
+DEFAULT_MIN_INTERVAL = 3600
+
+CONFIG_MAX_INTERVAL = "ckanext.check_link.schedule.max_interval"
+DEFAULT_MAX_INTERVAL = 604800
+
+CONFIG_MAX_BROKEN_INTERVAL = "ckanext.check_link.schedule.max_broken_interval"
+DEFAULT_MAX_BROKEN_INTERVAL = 86400
+
+CONFIG_BACKOFF = "ckanext.check_link.schedule.backoff"
+DEFAULT_BACKOFF = 0.5
+
+CONFIG_STATS_CACHE_TTL = "ckanext.check_link.stats.cache_ttl"
+DEFAULT_STATS_CACHE_TTL = 60
+
+CONFIG_EMAIL_TO = "ckanext.check_link.email_to"
+
+CONFIG_EMAIL_MAX_ROWS = "ckanext.check_link.email.max_rows"
+DEFAULT_EMAIL_MAX_ROWS = 200
+
+# columns of CSV attached to the broken link report
+EMAIL_REPORT_COLUMNS = [
+    "name",
+    "dataset_state",
+    "dataset_url",
+    "url",
+    "link_state",
+    "code",
+    "reason",
+    "explanation",
+    "broken_age",
+    "last_checked",
+    "last_available",
+]
+
 action, get_actions = Collector("check_link").split()
 
+_stats_cache: TTLCache[dict[str, Any]] = TTLCache(maxsize=128)
+
 log = logging.getLogger(__name__)
 
+
+def _schedule_policy() -> tuple[timedelta, timedelta, timedelta, float]:
+    """Limits of the interval between checks of the same link.
+
+    The longer link keeps its state, the less often it is checked: interval
+    grows as `backoff` fraction of time passed since the last status change,
+    but never leaves min/max boundaries. Broken links have lower upper
+    boundary, so that recovered links are detected quickly.
+
+    """
+    return (
+        timedelta(
+            seconds=tk.asint(tk.config.get(CONFIG_MIN_INTERVAL, DEFAULT_MIN_INTERVAL))
+        ),
+        timedelta(
+            seconds=tk.asint(tk.config.get(CONFIG_MAX_INTERVAL, DEFAULT_MAX_INTERVAL))
+        ),
+        timedelta(
+            seconds=tk.asint(
+                tk.config.get(CONFIG_MAX_BROKEN_INTERVAL, DEFAULT_MAX_BROKEN_INTERVAL)
+            )
+        ),
+        float(tk.config.get(CONFIG_BACKOFF, DEFAULT_BACKOFF)),
+    )
+
+
+def _next_check_at(state: str, last_status_change: datetime, now: datetime) -> datetime:
+    min_interval, max_interval, max_broken_interval, backoff = _schedule_policy()
+    upper = max_interval if state == "available" else max_broken_interval
+    interval = (now - last_status_change) * backoff
+
+    return now + min(max(interval, min_interval), upper)
+
+
 @action
 @validate(schema.report_save)
 def report_save(context, data_dict):
@@ -63,11 +144,164 @@ def report_save(context, data_dict):
                 continue
             setattr(report, k, v)
 
+    now = datetime.utcnow()
+    report.next_check_at = _next_check_at(
+        report.state, report.last_status_change or now, now
+    )
     sess.commit()
 
     return report.dictize(context)
 
 
+@action
+@validate(schema.report_save_many)
+def report_save_many(context, data_dict):
+    """Create or update multiple reports inside a single transaction.
+
+    Reports are identified by `resource_id`, or by `url` if they are not
+    attached to any resource. When `clear_available` is enabled, reports for
+    available links are removed instead of being saved.
+
+    """
+    tk.check_access("check_link_report_save_many", context, data_dict)
+    sess = context["session"]
+
+    attached: dict[str, dict[str, Any]] = {}
+    free: dict[str, dict[str, Any]] = {}
+    cleared: list[dict[str, Any]] = []
+
+    # later reports override earlier ones, because the same row cannot be
+    # updated twice by a single INSERT ... ON CONFLICT statement
+    for item in data_dict.get("reports", []):
+        details = dict(item["details"], **item.pop("__extras", {}))
+        row = {
+            "url": item["url"],
+            "state": item["state"],
+            "resource_id": item.get("resource_id"),
+            "details": details,
+        }
+        if data_dict["clear_available"] and row["state"] == "available":
+            cleared.append(row)
+        elif row["resource_id"]:
+            attached[row["resource_id"]] = row
+        else:
+            free[row["url"]] = row
+
+    if attached:
+        existing = {
+            id_
+            for id_, in sess.query(model.Resource.id).filter(
+                model.Resource.id.in_(attached)
+            )
+        }
+        missing = attached.keys() - existing
+        if missing:
+            raise tk.ValidationError(
+                {"resource_id": [f"Not found: {', '.join(sorted(missing))}"]}
+            )
+
+    now = datetime.utcnow()
+    table = Report.__table__
+    _upsert_reports(sess, list(attached.values()), now, [table.c.resource_id])
+    _upsert_reports(
+        sess,
+        list(free.values()),
+        now,
+        [table.c.url],
+        table.c.resource_id.is_(None),
+    )
+
+    deleted = 0
+    if cleared:
+        deleted = (
+            sess.query(Report)
+            .filter(
+                sa.or_(
+                    Report.resource_id.in_(
+                        [r["resource_id"] for r in cleared if r["resource_id"]]
+                    ),
+                    sa.and_(
+                        Report.resource_id.is_(None),
+                        Report.url.in_(
+                            [r["url"] for r in cleared if not r["resource_id"]]
+                        ),
+                    ),
+                )
+            )
+            .delete(synchronize_session=False)
+        )
+
+    sess.commit()
+
+    return {"saved": len(attached) + len(free), "deleted": deleted}
+
+
+def _upsert_reports(
+    sess,
+    rows: list[dict[str, Any]],
+    now: datetime,
+    index_elements: list[Any],
+    index_where: Any = None,
+):
+    """Insert reports or update existing ones following `report_save` rules."""
+    if not rows:
+        return
+
+    min_interval, max_interval, max_broken_interval, backoff = _schedule_policy()
+    table = Report.__table__
+    stmt = insert(table).values(
+        [
+            dict(
+                row,
+                id=make_uuid(),
+                last_checked=now,
+                last_status_change=now,
+                last_available=now,
+                next_check_at=_next_check_at(row["state"], now, now),
+            )
+            for row in rows
+        ]
+    )
+    excluded = stmt.excluded
+
+    last_status_change = sa.case(
+        [(table.c.state != excluded.state, now)],
+        else_=table.c.last_status_change,
+    )
+    interval = sa.func.least(
+        sa.func.greatest(
+            (sa.literal(now, sa.DateTime) - last_status_change) * backoff,
+            sa.literal(min_interval, sa.Interval),
+        ),
+        sa.case(
+            [(excluded.state == "available", sa.literal(max_interval, sa.Interval))],
+            else_=sa.literal(max_broken_interval, sa.Interval),
+        ),
+    )
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        index_where=index_where,
+        set_={
+            "url": excluded.url,
+            "state": excluded.state,
+            "details": excluded.details,
+            "last_checked": now,
+            # list of whens is supported by SQLAlchemy 1.3(CKAN 2.9)
+            "last_available": sa.case(
+                [
+                    (excluded.state == "available", now),
+                    (table.c.state == "available", table.c.last_checked),
+                ],
+                else_=table.c.last_available,
+            ),
+            "last_status_change": last_status_change,
+            "next_check_at": sa.literal(now, sa.DateTime) + interval,
+        },
+    )
+    sess.execute(stmt)
+
+
 @action
 @validate(schema.report_show)
 def report_show(context, data_dict):
@@ -123,16 +357,129 @@ def report_search(context, data_dict):
     if "include_state" in data_dict:
         q = q.filter(Report.state.in_(data_dict["include_state"]))
 
-    count = q.count()
-    q = q.order_by(Report.last_status_change.desc())
-    q = q.limit(data_dict["limit"]).offset(data_dict["offset"])
+    result: dict[str, Any] = {}
+    if data_dict["include_count"]:
+        result["count"] = q.count()
+
+    if "after" in data_dict:
+        last_status_change, id_ = _parse_cursor(data_dict["after"])
+        q = q.filter(
+            sa.tuple_(Report.last_status_change, Report.id)
+            < sa.tuple_(last_status_change, id_)
+        )
+
+    fields: Optional[list[str]] = data_dict.get("fields")
+    include_details = not fields or "details" in fields
+
+    q = q.order_by(Report.last_status_change.desc(), Report.id.desc())
+    q = Report.with_relations(q, include_details)
+    reports = q.limit(data_dict["limit"]).offset(data_dict["offset"]).all()
+
+    result["results"] = [
+        r.dictize(
+            dict(
+                context,
+                include_resource=include_details,
+                include_package=include_details,
+            )
+        )
+        for r in reports
+    ]
+    if fields:
+        result["results"] = [
+            {field: r[field] for field in fields if field in r}
+            for r in result["results"]
+        ]
+
+    # cursor is available only when there may be more reports
+    if reports and len(reports) == data_dict["limit"]:
+        result["next"] = _make_cursor(reports[-1])
+
+    return result
+
+
+def _make_cursor(report: Report) -> str:
+    """Position of the report in the search results, used as `after`."""
+    return "{},{}".format(report.last_status_change.isoformat(), report.id)
+
+
+def _parse_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        last_status_change, id_ = cursor.split(",", 1)
+        return datetime.fromisoformat(last_status_change), id_
+    except ValueError as e:
+        raise tk.ValidationError(
+            {"after": ["Must be a cursor from the previous search"]}
+        ) from e
+
+
+@action
+@validate(schema.report_stats)
+def report_stats(context, data_dict):
+    """Number of reports grouped by the given dimensions.
+
+    Supported dimensions are `state`, `organization`, `package`, `host` and
+    `code`. Results are cached for `ckanext.check_link.stats.cache_ttl`
+    seconds, unless `fresh` flag is set.
+
+    """
+    tk.check_access("check_link_report_stats", context, data_dict)
+
+    key = (
+        tuple(data_dict["group_by"]),
+        tuple(sorted(data_dict.get("exclude_state", []))),
+        tuple(sorted(data_dict.get("include_state", []))),
+        data_dict["limit"],
+    )
+    ttl = tk.asint(tk.config.get(CONFIG_STATS_CACHE_TTL, DEFAULT_STATS_CACHE_TTL))
+
+    if ttl and not data_dict["fresh"]:
+        cached = _stats_cache.get(key)
+        if cached is not None:
+            return cached
+
+    result = _report_stats(context["session"], data_dict)
+
+    if ttl:
+        _stats_cache.ttl = ttl
+        _stats_cache.set(key, result)
+
+    return result
+
+
+def _report_stats(sess, data_dict: dict[str, Any]) -> dict[str, Any]:
+    package_id = sa.func.coalesce(
+        model.Resource.package_id, Report.details["package_id"].astext
+    )
+    dimensions = {
+        "state": Report.state,
+        "organization": model.Package.owner_org,
+        "package": package_id,
+        "host": sa.func.lower(sa.func.substring(Report.url, "^[^:]+://([^/:?#]+)")),
+        "code": Report.details["code"].astext,
+    }
+    columns = [dimensions[name].label(name) for name in data_dict["group_by"]]
+    count = sa.func.count(Report.id).label("count")
+
+    q = sess.query(*columns, count).outerjoin(
+        model.Resource, model.Resource.id == Report.resource_id
+    )
+    if "organization" in data_dict["group_by"]:
+        q = q.outerjoin(model.Package, model.Package.id == package_id)
+
+    if "exclude_state" in data_dict:
+        q = q.filter(Report.state.notin_(data_dict["exclude_state"]))
+
+    if "include_state" in data_dict:
+        q = q.filter(Report.state.in_(data_dict["include_state"]))
+
+    total = q.with_entities(sa.func.count(Report.id)).scalar()
+    q = q.group_by(*columns).order_by(count.desc()).limit(data_dict["limit"])
 
     return {
-        "count": count,
-        "results": [
-            r.dictize(dict(context, include_resource=True, include_package=True))
-            for r in q
-        ],
+        "total": total,
+        "groups": [row._asdict() for row in q],
+        "generated": datetime.utcnow().isoformat(),
     }
 
 
@@ -161,88 +508,151 @@ def url_search(context, data_dict):
 @action
 @validate(schema.email_report)
 def email_report(context, data_dict):
+    """Send broken links to the site administrator.
 
-    q = context["session"].query(Report)
-
-    count = 0
-
-    q = q.filter(Report.state != 'available' )
-    count = q.count()
-    q = q.order_by(Report.last_available.desc())
-
-    log.info( 'count={}'.format( count ) )
-
-    body = ''
-    skipped = 0
-
-    for r in q:
-
-        try:
-
-            package_show = tk.get_action('package_show')
-            if r.package_id:
-                log.info( 'resource' )
-                pid =  r.package_id
-            else:
-                log.info( 'application' )
-                pid =  r.details['package_id']
-
-            dataset = package_show( context, {'id': pid} )
-
-
-            broken_age = r.last_checked - r.last_available
-
-            body += "<h2 style='margin-bottom: 0;'>{name}</h2>\nDataset State: {dataset_state}\nBroken link: {url}\nLink State: {link_state}\nCode / Reason / Explanation: {code} / {reason} / {explanation}\nBroken for {broken_age}\nLast checked: {last_checked}\nLast Available: {last_available}\nDataset URL: {dataset_url}\n\n".format(
-                name = dataset["title"],
-                broken_age = "{days} days, {hours} hours".format( days=broken_age.days, hours=( broken_age.seconds // 3600 ) ),
-                url = r.url,
-                link_state = r.state,
-                dataset_state = "Private" if dataset["private"] else "Published",
-                last_checked = r.last_checked.strftime("%m/%d/%Y at %I:%M%p").lower(),
-                last_available = r.last_available.strftime("%m/%d/%Y at %I:%M%p").lower(),
-                dataset_url = h.url_for('{}.read'.format( dataset["type"] ), id=dataset["name"], _external=True ),
-                code = r.details["code"],
-                reason = r.details["reason"],
-                explanation = r.details["explanation"],
-             )
-        except Exception as e: 
-            print(e)
-            # skip record if we don't have permission to access it, for instance if it is in the trash
-            log.info( 'Skipped record {}'.format( r.id ) )
-            skipped += 1
-            pass
+    Bodies are rendered as whole strings, because CKAN mailer accepts only
+    strings. Only the first `max_rows` links are included into them, while
+    the complete list is streamed from DB into the CSV attachment.
 
+    """
+    email_to = tk.config.get(CONFIG_EMAIL_TO)
+    if email_to is None:
+        raise Exception(
+            "{} is not set, so I can't e-mail this report".format(CONFIG_EMAIL_TO)
+        )
 
-    subject = '{site_title} | Broken Link Report'.format( site_title = tk.config.get('ckan.site_title') )
-    body_prefix =  \
-        "<li>{0} unavailable resource{1} found</li>".format(count, "s" if count != 1 else "" ) + \
-        "<li><a href='{url}/ckan-admin/broken-links'>This report is also available in the TWDH CKAN Admin</a></li>".format( url=tk.config.get('ckan.site_url')   )
+    max_rows = tk.asint(tk.config.get(CONFIG_EMAIL_MAX_ROWS, DEFAULT_EMAIL_MAX_ROWS))
+    q = _email_report_query(context)
 
-    email_to = tk.config.get('ckanext.check_link.email_to')
+    count = q.count()
+    log.info("count={}".format(count))
+
+    reports = [_email_report_row(row) for row in q.limit(max_rows)]
+
+    site_title = tk.config.get("ckan.site_title")
+    subject = "{site_title} | Broken Link Report".format(site_title=site_title)
+    body_prefix = [
+        "{0} unavailable resource{1} found".format(count, "s" if count != 1 else ""),
+    ]
+    if count > len(reports):
+        body_prefix.append(
+            "Only the first {} links are listed below".format(len(reports))
+        )
 
-    if( email_to == None ):
-        raise Exception("ckanext.check_link.email_to is not set, so I can't e-mail this report")
-    else:
-        mail_dict = {
-            'recipient_email': email_to,
-            'recipient_name': tk.config.get('ckan.site_title'),
-            'subject': subject,
-            'body': body,
-            'body_html': render_template(
-                f'check_link/emails/broken_link_report.html',
-                subject = subject,
-                prefix = body_prefix,
-                message = body,
-                site_title = tk.config.get('ckan.site_title'), 
-                site_url = tk.url_for( 'home.index', _external=True )
-            )
+    mail_dict: dict[str, Any] = {
+        "recipient_email": email_to,
+        "recipient_name": site_title,
+        "subject": subject,
+        "body": "\n\n".join(body_prefix + [_email_report_text(r) for r in reports]),
+        "body_html": render_template(
+            "check_link/emails/broken_link_report.html",
+            subject=subject,
+            prefix=body_prefix,
+            admin_url="{}/ckan-admin/broken-links".format(
+                tk.config.get("ckan.site_url")
+            ),
+            reports=reports,
+            site_title=site_title,
+            site_url=tk.url_for("home.index", _external=True),
+        ),
+    }
 
-        }
+    attachments = []
+    if "attachments" in inspect.signature(mailer.mail_recipient).parameters:
+        attachments.append(("broken-links.csv", _email_report_csv(q), "text/csv"))
+        mail_dict["attachments"] = attachments
 
     try:
         mailer.mail_recipient(**mail_dict)
     except (mailer.MailerException, socket.error):
-        pass
+        log.exception("Cannot send broken link report to %s", email_to)
+    finally:
+        for _name, content, _media_type in attachments:
+            content.close()
+
+
+def _email_report_query(context):
+    """Broken links together with details of their datasets.
+
+    Links of deleted datasets are skipped.
+
+    """
+    package_id = sa.func.coalesce(
+        model.Resource.package_id, Report.details["package_id"].astext
+    )
+
+    return (
+        context["session"]
+        .query(
+            Report.url,
+            Report.state,
+            Report.last_checked,
+            Report.last_available,
+            Report.details["code"].astext.label("code"),
+            Report.details["reason"].astext.label("reason"),
+            Report.details["explanation"].astext.label("explanation"),
+            model.Package.name.label("package_name"),
+            model.Package.title.label("package_title"),
+            model.Package.type.label("package_type"),
+            model.Package.private.label("package_private"),
+        )
+        .outerjoin(model.Resource, model.Resource.id == Report.resource_id)
+        .join(model.Package, model.Package.id == package_id)
+        .filter(Report.state != "available", model.Package.state != "deleted")
+        .order_by(Report.last_available.desc(), Report.id)
+    )
+
+
+def _email_report_row(row: Any) -> dict[str, Any]:
+    broken_age = row.last_checked - row.last_available
+
+    return {
+        "name": row.package_title,
+        "broken_age": "{days} days, {hours} hours".format(
+            days=broken_age.days, hours=(broken_age.seconds // 3600)
+        ),
+        "url": row.url,
+        "link_state": row.state,
+        "dataset_state": "Private" if row.package_private else "Published",
+        "last_checked": row.last_checked.strftime("%m/%d/%Y at %I:%M%p").lower(),
+        "last_available": row.last_available.strftime("%m/%d/%Y at %I:%M%p").lower(),
+        "dataset_url": h.url_for(
+            "{}.read".format(row.package_type), id=row.package_name, _external=True
+        ),
+        "code": row.code,
+        "reason": row.reason,
+        "explanation": row.explanation,
+    }
+
+
+def _email_report_text(report: dict[str, Any]) -> str:
+    return (
+        "{name}\nDataset State: {dataset_state}\nBroken link: {url}\n"
+        "Link State: {link_state}\n"
+        "Code / Reason / Explanation: {code} / {reason} / {explanation}\n"
+        "Broken for {broken_age}\nLast checked: {last_checked}\n"
+        "Last Available: {last_available}\nDataset URL: {dataset_url}"
+    ).format(**report)
+
+
+def _email_report_csv(q) -> IO[bytes]:
+    """All broken links of the report in CSV format.
+
+    Rows are written into a temporary file while they are fetched from DB,
+    so the size of the report does not affect memory usage.
+
+    """
+    dest = tempfile.TemporaryFile()
+    text = io.TextIOWrapper(dest, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, EMAIL_REPORT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(_email_report_row(row) for row in q.yield_per(1000))
+
+    text.flush()
+    text.detach()
+    dest.seek(0)
+    return dest
+
 
 @action
 @validate(schema.report_delete)
@@ -256,3 +666,42 @@ def report_delete(context, data_dict):
     sess.delete(entity)
     sess.commit()
     return entity.dictize(context)
+
+
+@action
+@validate(schema.report_delete_many)
+def report_delete_many(context, data_dict):
+    """Delete reports with the given IDs, resource IDs or URLs.
+
+    URLs identify only reports that are not attached to resources. All the
+    reports are removed by a single statement.
+
+    """
+    tk.check_access("check_link_report_delete_many", context, data_dict)
+    sess = context["session"]
+
+    conditions = []
+    if "id" in data_dict:
+        conditions.append(Report.id.in_(data_dict["id"]))
+
+    if "resource_id" in data_dict:
+        conditions.append(Report.resource_id.in_(data_dict["resource_id"]))
+
+    if "url" in data_dict:
+        conditions.append(
+            Report.resource_id.is_(None) & Report.url.in_(data_dict["url"])
+        )
+
+    if not conditions:
+        raise tk.ValidationError(
+            {"id": ["At least one of `id`, `resource_id` or `url` is required"]}
+        )
+
+    deleted = (
+        sess.query(Report)
+        .filter(sa.or_(*conditions))
+        .delete(synchronize_session=False)
+    )
+    sess.commit()
+
+    return {"deleted": deleted}
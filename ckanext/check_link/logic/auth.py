@@ -57,11 +57,29 @@ def application_check(context, data_dict):
     return authz.is_authorized("package_search", context, data_dict)
 
 
+@auth
+def db_check(context, data_dict):
+    # DB enumeration skips permission labels applied by package_search
+    return authz.is_authorized("sysadmin", context, data_dict)
+
+
+@auth
+def job_status(context, data_dict):
+    # only the author of the job and sysadmins can see it. This is verified
+    # by the action, because the job must be loaded first
+    return {"success": not authz.auth_is_anon_user(context)}
+
+
 @auth
 def report_save(context, data_dict):
     return authz.is_authorized("sysadmin", context, data_dict)
 
 
+@auth
+def report_save_many(context, data_dict):
+    return authz.is_authorized("sysadmin", context, data_dict)
+
+
 @auth
 def report_show(context, data_dict):
     return authz.is_authorized("sysadmin", context, data_dict)
@@ -83,6 +101,31 @@ def report_delete(context, data_dict):
     return authz.is_authorized("sysadmin", context, data_dict)
 
 
+@auth
+def report_stats(context, data_dict):
+    return authz.is_authorized("sysadmin", context, data_dict)
+
+
+@auth
+def report_delete_many(context, data_dict):
+    return authz.is_authorized("sysadmin", context, data_dict)
+
+
+@auth
+def history_prune(context, data_dict):
+    return authz.is_authorized("sysadmin", context, data_dict)
+
+
+@auth
+def link_uptime(context, data_dict):
+    return authz.is_authorized("sysadmin", context, data_dict)
+
+
 @auth
 def view_report_page(context, data_dict):
     return authz.is_authorized("sysadmin", context, data_dict)
+
+
+@auth
+def view_metrics(context, data_dict):
+    return authz.is_authorized("sysadmin", context, data_dict)
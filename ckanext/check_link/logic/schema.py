@@ -8,6 +8,9 @@ def url_check(
     default,
     convert_to_json_if_string,
     boolean_validator,
+    ignore_missing,
+    natural_number_validator,
+    check_link_non_negative_float,
 ):
     return {
         "url": [not_missing, json_list_or_string],
@@ -15,6 +18,12 @@ def url_check(
         "clear_available": [default(False), boolean_validator],
         "skip_invalid": [default(False), boolean_validator],
         "link_patch": [default("{}"), convert_to_json_if_string],
+        "concurrency": [ignore_missing, natural_number_validator],
+        "host_concurrency": [ignore_missing, natural_number_validator],
+        "host_interval": [ignore_missing, check_link_non_negative_float],
+        "conditional": [ignore_missing, boolean_validator],
+        "max_age": [ignore_missing, natural_number_validator],
+        "async": [default(False), boolean_validator],
     }
 
 
@@ -36,7 +45,14 @@ def resource_check(
 
 @validator_args
 def base_search_check(
-    boolean_validator, default, int_validator, convert_to_json_if_string
+    unicode_safe,
+    boolean_validator,
+    default,
+    int_validator,
+    convert_to_json_if_string,
+    ignore_missing,
+    natural_number_validator,
+    check_link_non_negative_float,
 ):
     return {
         "save": [default(False), boolean_validator],
@@ -47,7 +63,15 @@ def base_search_check(
         "include_private": [default(False), boolean_validator],
         "start": [default(0), int_validator],
         "rows": [default(10), int_validator],
+        "keyset": [default(False), boolean_validator],
+        "after": [ignore_missing, unicode_safe],
         "link_patch": [default("{}"), convert_to_json_if_string],
+        "concurrency": [ignore_missing, natural_number_validator],
+        "host_concurrency": [ignore_missing, natural_number_validator],
+        "host_interval": [ignore_missing, check_link_non_negative_float],
+        "max_age": [ignore_missing, natural_number_validator],
+        "due_only": [default(False), boolean_validator],
+        "async": [default(False), boolean_validator],
     }
 
 
@@ -80,6 +104,20 @@ def application_check(unicode_safe, default):
     return dict(base_search_check(), fq=[default("*:*"), unicode_safe])
 
 
+@validator_args
+def db_check(ignore_missing, json_list_or_string):
+    schema = dict(
+        base_search_check(),
+        ids=[ignore_missing, json_list_or_string],
+        resource_ids=[ignore_missing, json_list_or_string],
+        type=[ignore_missing, json_list_or_string],
+    )
+    # packages are selected by ID, so there is nothing to paginate
+    for field in ["start", "rows", "keyset", "after", "async"]:
+        schema.pop(field)
+    return schema
+
+
 @validator_args
 def report_save(
     unicode_safe,
@@ -98,6 +136,26 @@ def report_save(
     }
 
 
+@validator_args
+def report_save_many(default, boolean_validator):
+    return {
+        "reports": report_save_many_item(),
+        "clear_available": [default(False), boolean_validator],
+    }
+
+
+@validator_args
+def report_save_many_item(
+    unicode_safe, ignore_missing, not_missing, default, convert_to_json_if_string
+):
+    return {
+        "url": [not_missing, unicode_safe],
+        "state": [not_missing, unicode_safe],
+        "resource_id": [ignore_missing, unicode_safe],
+        "details": [default("{}"), convert_to_json_if_string],
+    }
+
+
 @validator_args
 def report_show(unicode_safe, ignore_missing, resource_id_exists):
     return {
@@ -109,11 +167,20 @@ def report_show(unicode_safe, ignore_missing, resource_id_exists):
 
 @validator_args
 def report_search(
-    ignore_empty, default, int_validator, boolean_validator, json_list_or_string
+    ignore_empty,
+    default,
+    int_validator,
+    boolean_validator,
+    json_list_or_string,
+    ignore_missing,
+    unicode_safe,
 ):
     return {
         "limit": [default(10), int_validator],
         "offset": [default(0), int_validator],
+        "after": [ignore_missing, unicode_safe],
+        "include_count": [default(True), boolean_validator],
+        "fields": [ignore_empty, json_list_or_string],
         "exclude_state": [ignore_empty, json_list_or_string],
         "include_state": [ignore_empty, json_list_or_string],
         "attached_only": [default(False), boolean_validator],
@@ -136,3 +203,53 @@ def email_report():
 @validator_args
 def report_delete(unicode_safe, not_missing):
     return report_show()
+
+
+@validator_args
+def report_delete_many(ignore_empty, json_list_or_string):
+    return {
+        "id": [ignore_empty, json_list_or_string],
+        "resource_id": [ignore_empty, json_list_or_string],
+        "url": [ignore_empty, json_list_or_string],
+    }
+
+
+@validator_args
+def history_prune():
+    return {}
+
+
+@validator_args
+def link_uptime(ignore_missing, unicode_safe, default, is_positive_integer):
+    return {
+        "url": [ignore_missing, unicode_safe],
+        "host": [ignore_missing, unicode_safe],
+        "days": [default(90), is_positive_integer],
+    }
+
+
+@validator_args
+def report_stats(
+    default,
+    ignore_empty,
+    json_list_or_string,
+    boolean_validator,
+    int_validator,
+    check_link_stats_dimensions,
+):
+    return {
+        "group_by": [
+            default("state"),
+            json_list_or_string,
+            check_link_stats_dimensions,
+        ],
+        "exclude_state": [ignore_empty, json_list_or_string],
+        "include_state": [ignore_empty, json_list_or_string],
+        "limit": [default(100), int_validator],
+        "fresh": [default(False), boolean_validator],
+    }
+
+
+@validator_args
+def job_status(not_missing, unicode_safe):
+    return {"id": [not_missing, unicode_safe]}
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import Any
+
+import ckan.plugins.toolkit as tk
+
+from ckanext.toolbelt.decorators import Collector
+
+validator, get_validators = Collector("check_link").split()
+
+
+@validator
+def non_negative_float(value: Any) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise tk.Invalid("Must be a number")
+
+    if value < 0:
+        raise tk.Invalid("Must be a positive number or zero")
+
+    return value
+
+
+# dimensions supported by `check_link_report_stats`
+STATS_DIMENSIONS = ("state", "organization", "package", "host", "code")
+
+
+@validator
+def stats_dimensions(value: Any) -> list[str]:
+    unknown = set(value) - set(STATS_DIMENSIONS)
+    if unknown:
+        raise tk.Invalid(
+            "Unsupported dimensions: {}. Allowed: {}".format(
+                ", ".join(sorted(unknown)), ", ".join(STATS_DIMENSIONS)
+            )
+        )
+
+    return value
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import bisect
+import contextlib
+import os
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+import ckan.plugins.toolkit as tk
+
+from . import profiling
+
+CONFIG_ENABLED = "ckanext.check_link.metrics.enabled"
+DEFAULT_ENABLED = False
+
+# seconds; suitable both for single requests and for phases of a batch
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+    """Family of samples that share the name and the set of labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: dict[tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                "{} expects labels {}, got {}".format(
+                    self.name, self.labels, tuple(labels)
+                )
+            )
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self) -> dict[tuple[str, ...], Any]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: dict[tuple[str, ...], Any]):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        for key, value in sorted(self.snapshot().items()):
+            yield self.name, self.labels, key, value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def merge(self, values: dict[tuple[str, ...], Any]):
+        # gauges describe the current state of the process that owns them
+        pass
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ((0,) * len(self.buckets), 0.0, 0)
+            )
+            # values above the last bucket are counted only by +Inf
+            if idx < len(counts):
+                counts = counts[:idx] + (counts[idx] + 1,) + counts[idx + 1 :]
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, values: dict[tuple[str, ...], Any]):
+        with self._lock:
+            for key, (counts, total, count) in values.items():
+                if key in self._values:
+                    old_counts, old_total, old_count = self._values[key]
+                    counts = tuple(a + b for a, b in zip(old_counts, counts))
+                    total += old_total
+                    count += old_count
+                self._values[key] = (counts, total, count)
+
+    def samples(self) -> Iterator[tuple[str, tuple[str, ...], tuple[str, ...], float]]:
+        labels = self.labels + ("le",)
+        for key, (counts, total, count) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, amount in zip(self.buckets, counts):
+                cumulative += amount
+                yield self.name + "_bucket", labels, key + (str(bound),), cumulative
+            yield self.name + "_bucket", labels, key + ("+Inf",), count
+            yield self.name + "_sum", self.labels, key, total
+            yield self.name + "_count", self.labels, key, count
+
+
+class Registry:
+    """Process-level collection of metrics.
+
+    Samples are recorded only when metrics are enabled by config option or
+    when `active` flag is set, e.g. by CLI command that writes metrics into
+    the file.
+
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.active = False
+
+    def register(self, metric: Metric) -> Any:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+    def pop(self) -> dict[str, dict[tuple[str, ...], Any]]:
+        """Return collected values and start from scratch.
+
+        Used for passing samples from the worker process to the parent.
+
+        """
+        result = {name: metric.snapshot() for name, metric in self.metrics.items()}
+        self.clear()
+        return result
+
+    def merge(self, values: dict[str, dict[tuple[str, ...], Any]]):
+        for name, samples in values.items():
+            if name in self.metrics:
+                self.metrics[name].merge(samples)
+
+    def render(self) -> str:
+        """Serialize metrics using Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in self.metrics.values():
+            lines.append(
+                "# HELP {} {}".format(metric.name, _escape_help(metric.documentation))
+            )
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for name, labels, values, value in metric.samples():
+                lines.append(
+                    "{}{} {}".format(name, _format_labels(labels, values), value)
+                )
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+links_checked = registry.register(
+    Counter("check_link_links_checked_total", "Number of checked links", ("state",))
+)
+host_checks = registry.register(
+    Counter(
+        "check_link_host_checks_total",
+        "Number of checked links per host and state",
+        ("host", "state"),
+    )
+)
+request_duration = registry.register(
+    Histogram(
+        "check_link_request_duration_seconds",
+        "Duration of HTTP requests per host",
+        ("host",),
+    )
+)
+phase_duration = registry.register(
+    Histogram(
+        "check_link_phase_duration_seconds",
+        "Duration of check phases: enumerate, search, http, save and checkpoint",
+        ("phase",),
+    )
+)
+requests_in_flight = registry.register(
+    Gauge("check_link_requests_in_flight", "Number of HTTP requests in progress")
+)
+chunks_in_flight = registry.register(
+    Gauge(
+        "check_link_chunks_in_flight",
+        "Number of chunks sent to worker processes and not collected yet",
+    )
+)
+retries = registry.register(
+    Counter(
+        "check_link_retries_total",
+        "Number of repeated requests, e.g. GET after HEAD that is not allowed",
+        ("reason",),
+    )
+)
+
+
+def is_enabled() -> bool:
+    return registry.active or tk.asbool(tk.config.get(CONFIG_ENABLED, DEFAULT_ENABLED))
+
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Measure duration of the phase, if metrics or profiling are enabled."""
+    enabled = is_enabled()
+    profile = profiling.active()
+    if not enabled and profile is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if enabled:
+            phase_duration.observe(elapsed, phase=name)
+        if profile is not None:
+            profile.add_phase(name, elapsed)
+
+
+def observe_link(url: str, host: str, state: str, elapsed: Optional[float]):
+    profile = profiling.active()
+    if profile is not None and elapsed is not None:
+        profile.add_link(url, host, elapsed)
+
+    if not is_enabled():
+        return
+
+    links_checked.inc(state=state)
+    host_checks.inc(host=host, state=state)
+    if elapsed is not None:
+        request_duration.observe(elapsed, host=host)
+
+
+def write(path: str):
+    """Atomically replace the file with the current metrics.
+
+    Format is compatible with textfile collector of node_exporter.
+
+    """
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "w") as dest:
+        dest.write(registry.render())
+    os.replace(tmp, path)
+
+
+def _format_labels(labels: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not labels:
+        return ""
+
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(label, _escape_label(value))
+            for label, value in zip(labels, values)
+        )
+    )
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
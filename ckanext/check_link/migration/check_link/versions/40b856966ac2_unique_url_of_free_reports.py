@@ -0,0 +1,41 @@
+"""Unique URL of free reports
+
+Revision ID: 40b856966ac2
+Revises: 564f2016af51
+Create Date: 2026-10-17 09:12:31.418205
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "40b856966ac2"
+down_revision = "564f2016af51"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keep only the most recent report for every URL that is not attached to
+    # a resource, otherwise the unique index cannot be created
+    op.execute(
+        """
+        DELETE FROM check_link_report r
+        USING check_link_report newer
+        WHERE r.resource_id IS NULL
+            AND newer.resource_id IS NULL
+            AND r.url = newer.url
+            AND (r.last_checked, r.id) < (newer.last_checked, newer.id)
+        """
+    )
+    op.create_index(
+        "check_link_report_free_url_idx",
+        "check_link_report",
+        ["url"],
+        unique=True,
+        postgresql_where=sa.text("resource_id IS NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("check_link_report_free_url_idx", "check_link_report")
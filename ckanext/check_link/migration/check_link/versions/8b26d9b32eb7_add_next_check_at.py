@@ -0,0 +1,29 @@
+"""Add next_check_at
+
+Revision ID: 8b26d9b32eb7
+Revises: 40b856966ac2
+Create Date: 2026-10-17 10:41:08.274915
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8b26d9b32eb7"
+down_revision = "40b856966ac2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "check_link_report", sa.Column("next_check_at", sa.DateTime, nullable=True)
+    )
+    op.create_index(
+        "check_link_report_next_check_at_idx", "check_link_report", ["next_check_at"]
+    )
+
+
+def downgrade():
+    op.drop_index("check_link_report_next_check_at_idx", "check_link_report")
+    op.drop_column("check_link_report", "next_check_at")
@@ -0,0 +1,46 @@
+"""Create run table
+
+Revision ID: b114f643a86b
+Revises: 8b26d9b32eb7
+Create Date: 2026-10-17 11:27:52.605331
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import JSONB
+
+# revision identifiers, used by Alembic.
+revision = "b114f643a86b"
+down_revision = "8b26d9b32eb7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "check_link_run",
+        sa.Column("id", sa.UnicodeText, primary_key=True),
+        sa.Column("command", sa.String(50), nullable=False),
+        sa.Column("params", JSONB, nullable=False),
+        sa.Column("state", sa.String(20), nullable=False),
+        sa.Column("checkpoint", sa.UnicodeText, nullable=True),
+        sa.Column("processed", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("stats", JSONB, nullable=False),
+        sa.Column(
+            "started",
+            sa.DateTime,
+            nullable=False,
+            server_default=sa.func.current_timestamp(),
+        ),
+        sa.Column(
+            "updated",
+            sa.DateTime,
+            nullable=False,
+            server_default=sa.func.current_timestamp(),
+        ),
+        sa.Index("check_link_run_command_idx", "command", "state"),
+    )
+
+
+def downgrade():
+    op.drop_table("check_link_run")
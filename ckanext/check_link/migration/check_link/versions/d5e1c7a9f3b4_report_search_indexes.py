@@ -0,0 +1,40 @@
+"""Report search indexes
+
+Revision ID: d5e1c7a9f3b4
+Revises: b114f643a86b
+Create Date: 2026-10-17 13:05:47.902113
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d5e1c7a9f3b4"
+down_revision = "b114f643a86b"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "check_link_report_status_change_idx",
+        "check_link_report",
+        ["last_status_change", "id"],
+    )
+    op.create_index(
+        "check_link_report_state_status_change_idx",
+        "check_link_report",
+        ["state", "last_status_change", "id"],
+    )
+    op.create_index(
+        "check_link_report_free_status_change_idx",
+        "check_link_report",
+        ["last_status_change", "id"],
+        postgresql_where=sa.text("resource_id IS NULL"),
+    )
+
+
+def downgrade():
+    op.drop_index("check_link_report_free_status_change_idx", "check_link_report")
+    op.drop_index("check_link_report_state_status_change_idx", "check_link_report")
+    op.drop_index("check_link_report_status_change_idx", "check_link_report")
@@ -0,0 +1,87 @@
+"""Create history tables
+
+Revision ID: e2f4a6b8c0d1
+Revises: d5e1c7a9f3b4
+Create Date: 2026-10-17 14:22:09.318467
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e2f4a6b8c0d1"
+down_revision = "d5e1c7a9f3b4"
+branch_labels = None
+depends_on = None
+
+
+def _rollup_columns():
+    return [
+        sa.Column("day", sa.Date, primary_key=True),
+        sa.Column("checks", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("available", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("latency_total", sa.BigInteger, nullable=False, server_default="0"),
+        sa.Column("latency_checks", sa.Integer, nullable=False, server_default="0"),
+    ]
+
+
+def upgrade():
+    op.create_table(
+        "check_link_host",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("name", sa.UnicodeText, nullable=False, unique=True),
+    )
+    op.create_table(
+        "check_link_url",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("url", sa.UnicodeText, nullable=False, unique=True),
+        sa.Column(
+            "host_id",
+            sa.Integer,
+            sa.ForeignKey("check_link_host.id"),
+            nullable=False,
+            index=True,
+        ),
+    )
+    op.create_table(
+        "check_link_history",
+        sa.Column(
+            "url_id",
+            sa.Integer,
+            sa.ForeignKey("check_link_url.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("checked_at", sa.DateTime, primary_key=True),
+        sa.Column("state", sa.SmallInteger, nullable=False),
+        sa.Column("code", sa.SmallInteger, nullable=True),
+        sa.Column("latency", sa.Integer, nullable=True),
+        sa.Index("check_link_history_checked_at_idx", "checked_at"),
+    )
+    op.create_table(
+        "check_link_rollup_link",
+        sa.Column(
+            "url_id",
+            sa.Integer,
+            sa.ForeignKey("check_link_url.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        *_rollup_columns(),
+    )
+    op.create_table(
+        "check_link_rollup_host",
+        sa.Column(
+            "host_id",
+            sa.Integer,
+            sa.ForeignKey("check_link_host.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        *_rollup_columns(),
+    )
+
+
+def downgrade():
+    op.drop_table("check_link_rollup_host")
+    op.drop_table("check_link_rollup_link")
+    op.drop_table("check_link_history")
+    op.drop_table("check_link_url")
+    op.drop_table("check_link_host")
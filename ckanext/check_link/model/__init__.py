@@ -1,3 +1,14 @@
+from .history import STATE_CODES, History, Host, HostRollup, LinkRollup, TrackedUrl
 from .report import Report
+from .run import Run
 
-__all__ = ["Report"]
+__all__ = [
+    "Report",
+    "Run",
+    "Host",
+    "TrackedUrl",
+    "History",
+    "LinkRollup",
+    "HostRollup",
+    "STATE_CODES",
+]
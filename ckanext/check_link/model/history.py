@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    SmallInteger,
+    UnicodeText,
+)
+
+from .base import Base
+
+# compact representation of link states inside history tables. Unknown
+# states are stored as zero.
+STATE_CODES = {
+    "unknown": 0,
+    "available": 1,
+    "moved": 2,
+    "missing": 3,
+    "protected": 4,
+    "invalid": 5,
+    "timeout": 6,
+    "error": 7,
+}
+
+
+class Host(Base):
+    """Host of the checked links, referenced by history rows."""
+
+    __tablename__ = "check_link_host"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(UnicodeText, nullable=False, unique=True)
+
+
+class TrackedUrl(Base):
+    """URL that has at least one entry in the check history."""
+
+    __tablename__ = "check_link_url"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    url = Column(UnicodeText, nullable=False, unique=True)
+    host_id = Column(Integer, ForeignKey(Host.id), nullable=False, index=True)
+
+
+class History(Base):
+    """Result of a single check of the URL.
+
+    Rows are only appended and removed after the retention period, so every
+    column is kept as small as possible.
+
+    """
+
+    __tablename__ = "check_link_history"
+    __table_args__ = (Index("check_link_history_checked_at_idx", "checked_at"),)
+
+    url_id = Column(
+        Integer, ForeignKey(TrackedUrl.id, ondelete="CASCADE"), primary_key=True
+    )
+    checked_at = Column(DateTime, primary_key=True)
+    state = Column(SmallInteger, nullable=False)
+    code = Column(SmallInteger, nullable=True)
+    latency = Column(Integer, nullable=True)
+
+
+class LinkRollup(Base):
+    """Daily summary of checks of the URL."""
+
+    __tablename__ = "check_link_rollup_link"
+
+    url_id = Column(
+        Integer, ForeignKey(TrackedUrl.id, ondelete="CASCADE"), primary_key=True
+    )
+    day = Column(Date, primary_key=True)
+    checks = Column(Integer, nullable=False, default=0)
+    available = Column(Integer, nullable=False, default=0)
+    latency_total = Column(BigInteger, nullable=False, default=0)
+    latency_checks = Column(Integer, nullable=False, default=0)
+
+
+class HostRollup(Base):
+    """Daily summary of checks of all the URLs from the host."""
+
+    __tablename__ = "check_link_rollup_host"
+
+    host_id = Column(
+        Integer, ForeignKey(Host.id, ondelete="CASCADE"), primary_key=True
+    )
+    day = Column(Date, primary_key=True)
+    checks = Column(Integer, nullable=False, default=0)
+    available = Column(Integer, nullable=False, default=0)
+    latency_total = Column(BigInteger, nullable=False, default=0)
+    latency_checks = Column(Integer, nullable=False, default=0)
@@ -5,19 +5,21 @@ from typing import Any, Iterable, Optional
 
 import ckan.model as model
 from ckan.lib.dictization import table_dictize
-from ckan.lib.dictization.model_dictize import package_dictize, resource_dictize
+from ckan.lib.dictization.model_dictize import resource_dictize
 from ckan.model.types import make_uuid
 from sqlalchemy import (
     Column,
     DateTime,
     ForeignKey,
+    Index,
     String,
     UnicodeText,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import Query, backref, joinedload, relationship
 from typing_extensions import Self
 
 from .base import Base
@@ -25,6 +27,30 @@ from .base import Base
 
 class Report(Base):
     __tablename__ = "check_link_report"
+    __table_args__ = (
+        Index(
+            "check_link_report_free_url_idx",
+            "url",
+            unique=True,
+            postgresql_where=text("resource_id IS NULL"),
+        ),
+        Index("check_link_report_next_check_at_idx", "next_check_at"),
+        Index(
+            "check_link_report_status_change_idx", "last_status_change", "id"
+        ),
+        Index(
+            "check_link_report_state_status_change_idx",
+            "state",
+            "last_status_change",
+            "id",
+        ),
+        Index(
+            "check_link_report_free_status_change_idx",
+            "last_status_change",
+            "id",
+            postgresql_where=text("resource_id IS NULL"),
+        ),
+    )
 
     id = Column(UnicodeText, primary_key=True, default=make_uuid)
     url = Column(UnicodeText, nullable=False)
@@ -33,6 +59,7 @@ class Report(Base):
     last_checked = Column(DateTime, nullable=False, default=datetime.utcnow)
     last_status_change = Column(DateTime, nullable=False, default=datetime.utcnow)
     last_available = Column(DateTime, nullable=False, default=datetime.utcnow)
+    next_check_at = Column(DateTime, nullable=True)
 
     resource_id = Column(
         UnicodeText, ForeignKey(model.Resource.id), nullable=True, unique=True
@@ -62,10 +89,24 @@ class Report(Base):
             result["details"]["resource"] = resource_dictize(self.resource, context)
 
         if context.get("include_package") and self.package_id:
-            result["details"]["package"] = resource_dictize(self.package, context)
+            result["details"]["package"] = table_dictize(self.package, context)
 
         return result
 
+    @classmethod
+    def with_relations(cls, q: Query, include_package: bool = True) -> Query:
+        """Load resources and packages of reports together with reports.
+
+        Without it every call to `dictize` lazy-loads resource and package
+        of the report separately.
+
+        """
+        resource = joinedload(cls.resource)
+        if include_package:
+            resource = resource.joinedload(model.Resource.package)
+
+        return q.options(resource)
+
     @classmethod
     def by_resource_id(cls, id_: str) -> Optional[Self]:
         if not id_:
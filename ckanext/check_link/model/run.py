@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Optional
+
+import ckan.model as model
+from ckan.model.types import make_uuid
+from sqlalchemy import Column, DateTime, Integer, String, UnicodeText
+from sqlalchemy.dialects.postgresql import JSONB
+from typing_extensions import Self
+
+from .base import Base
+
+
+class Run(Base):
+    """Progress of the CLI command that checks links.
+
+    Checkpoint is updated after every committed chunk, so that interrupted
+    run can be continued instead of starting from scratch.
+
+    """
+
+    __tablename__ = "check_link_run"
+
+    id = Column(UnicodeText, primary_key=True, default=make_uuid)
+    command = Column(String(50), nullable=False)
+    params = Column(JSONB, nullable=False, default=dict)
+    state = Column(String(20), nullable=False, default="running")
+
+    checkpoint = Column(UnicodeText, nullable=True)
+    processed = Column(Integer, nullable=False, default=0)
+    stats = Column(JSONB, nullable=False, default=dict)
+
+    started = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def advance(self, checkpoint: str, processed: int, stats: dict[str, Any]):
+        self.checkpoint = checkpoint
+        self.processed += processed
+        self.stats = dict(stats)
+        self.updated = datetime.utcnow()
+
+    def finish(self):
+        self.state = "finished"
+        self.updated = datetime.utcnow()
+
+    @classmethod
+    def last_unfinished(cls, command: str, params: dict[str, Any]) -> Optional[Self]:
+        return (
+            model.Session.query(cls)
+            .filter(
+                cls.command == command,
+                cls.params == params,
+                cls.state != "finished",
+            )
+            .order_by(cls.started.desc())
+            .first()
+        )
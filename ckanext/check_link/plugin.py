@@ -3,15 +3,11 @@ from __future__ import annotations
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 
-from . import cli, views
-from .logic import action, auth
+from . import cli, recheck, views
+from .helpers import get_package_title
+from .logic import action, auth, validators
 
 
-def get_package_title(package_id: str) -> str:
-    """Return the title of the package with the given ID"""
-    package = toolkit.get_action("package_show")({}, {"id": package_id})
-    return package["title"]
-
 class CheckLinkPlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IConfigurer)
     plugins.implements(plugins.IActions)
@@ -19,6 +15,9 @@ class CheckLinkPlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IBlueprint)
     plugins.implements(plugins.IClick)
     plugins.implements(plugins.ITemplateHelpers)
+    plugins.implements(plugins.IValidators)
+    plugins.implements(plugins.IResourceController, inherit=True)
+    plugins.implements(plugins.IPackageController, inherit=True)
 
     # IConfigurer
 
@@ -31,6 +30,10 @@ class CheckLinkPlugin(plugins.SingletonPlugin):
     def get_actions(self):
         return action.get_actions()
 
+    # IValidators
+    def get_validators(self):
+        return validators.get_validators()
+
     # IAuthFunctions
     def get_auth_functions(self):
         return auth.get_auth_functions()
@@ -52,4 +55,44 @@ class CheckLinkPlugin(plugins.SingletonPlugin):
             return {
                 'get_package_title': get_package_title,
             }
-    
+
+    # IResourceController
+
+    def after_resource_create(self, context, resource):
+        if recheck.is_enabled():
+            recheck.resources_changed([resource])
+
+    def after_resource_update(self, context, resource):
+        if recheck.is_enabled():
+            recheck.resources_changed([resource])
+
+    def before_resource_delete(self, context, resource, resources):
+        if recheck.is_enabled():
+            recheck.resource_deleted(resource["id"])
+
+    # IPackageController
+
+    def after_dataset_create(self, context, pkg_dict):
+        if recheck.is_enabled():
+            recheck.package_changed(pkg_dict)
+
+    def after_dataset_update(self, context, pkg_dict):
+        if recheck.is_enabled():
+            recheck.package_changed(pkg_dict)
+
+    # CKAN 2.9 uses the same names for hooks of resources and packages
+
+    def after_create(self, context, data_dict):
+        if "package_id" in data_dict:
+            self.after_resource_create(context, data_dict)
+        else:
+            self.after_dataset_create(context, data_dict)
+
+    def after_update(self, context, data_dict):
+        if "package_id" in data_dict:
+            self.after_resource_update(context, data_dict)
+        else:
+            self.after_dataset_update(context, data_dict)
+
+    def before_delete(self, context, resource, resources):
+        self.before_resource_delete(context, resource, resources)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import heapq
+import time
+from typing import Any, Optional
+
+DEFAULT_TOP = 10
+
+
+class Profile:
+    """Lightweight timings of a single run.
+
+    Only aggregates are kept: total time of every phase, `top` slowest
+    links and chunks with the greatest number of queries, and totals per
+    host. Memory usage does not depend on the size of the run.
+
+    """
+
+    def __init__(self, top: int = DEFAULT_TOP):
+        self.top = top
+        self.started = time.perf_counter()
+        self.phases: dict[str, list[float]] = {}
+        self.hosts: dict[str, list[float]] = {}
+        self.links: list[tuple[float, str, str]] = []
+        self.chunks: list[tuple[int, int, int, float]] = []
+        self.chunk_count = 0
+        self.queries = 0
+        self.pending_queries = 0
+        self._chunk_started = self.started
+
+    def add_phase(self, name: str, elapsed: float):
+        total = self.phases.setdefault(name, [0, 0.0])
+        total[0] += 1
+        total[1] += elapsed
+
+    def add_link(self, url: str, host: str, elapsed: float):
+        total = self.hosts.setdefault(host, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += elapsed
+        total[2] = max(total[2], elapsed)
+        _push(self.links, (elapsed, url, host), self.top)
+
+    def add_query(self):
+        self.pending_queries += 1
+
+    def chunk_done(self, items: int):
+        """Attribute queries made since the previous chunk to the current one."""
+        now = time.perf_counter()
+        self.chunk_count += 1
+        self.queries += self.pending_queries
+        _push(
+            self.chunks,
+            (self.pending_queries, self.chunk_count, items, now - self._chunk_started),
+            self.top,
+        )
+        self.pending_queries = 0
+        self._chunk_started = now
+
+    def pop(self) -> dict[str, Any]:
+        """Return collected data of the worker process and start from scratch."""
+        data = {
+            "phases": self.phases,
+            "hosts": self.hosts,
+            "links": self.links,
+            "queries": self.pending_queries,
+        }
+        self.phases, self.hosts, self.links = {}, {}, []
+        self.pending_queries = 0
+        return data
+
+    def merge(self, data: dict[str, Any]):
+        for name, (count, elapsed) in data["phases"].items():
+            total = self.phases.setdefault(name, [0, 0.0])
+            total[0] += count
+            total[1] += elapsed
+
+        for host, (count, elapsed, slowest) in data["hosts"].items():
+            total = self.hosts.setdefault(host, [0, 0.0, 0.0])
+            total[0] += count
+            total[1] += elapsed
+            total[2] = max(total[2], slowest)
+
+        for link in data["links"]:
+            _push(self.links, tuple(link), self.top)
+
+        self.pending_queries += data["queries"]
+
+    def as_dict(self) -> dict[str, Any]:
+        wall = time.perf_counter() - self.started
+        hosts = sorted(self.hosts.items(), key=lambda item: item[1][1], reverse=True)
+
+        return {
+            "wall_time": wall,
+            "phases": {
+                name: {"count": count, "seconds": elapsed}
+                for name, (count, elapsed) in sorted(
+                    self.phases.items(), key=lambda item: item[1][1], reverse=True
+                )
+            },
+            "slowest_urls": [
+                {"url": url, "host": host, "seconds": elapsed}
+                for elapsed, url, host in sorted(self.links, reverse=True)
+            ],
+            "slowest_hosts": [
+                {
+                    "host": host,
+                    "links": count,
+                    "seconds": elapsed,
+                    "average": elapsed / count,
+                    "max": slowest,
+                }
+                for host, (count, elapsed, slowest) in hosts[: self.top]
+            ],
+            "queries": {
+                "total": self.queries,
+                "chunks": self.chunk_count,
+                "per_chunk": self.queries / self.chunk_count if self.chunk_count else 0,
+                "busiest_chunks": [
+                    {
+                        "chunk": chunk,
+                        "items": items,
+                        "queries": queries,
+                        "seconds": elapsed,
+                    }
+                    for queries, chunk, items, elapsed in sorted(
+                        self.chunks, reverse=True
+                    )
+                ],
+            },
+        }
+
+
+_active: Optional[Profile] = None
+
+
+def active() -> Optional[Profile]:
+    return _active
+
+
+def start(top: int = DEFAULT_TOP) -> Profile:
+    global _active
+    _active = Profile(top)
+    return _active
+
+
+def stop():
+    global _active
+    _active = None
+
+
+def reset():
+    """Start from scratch in the forked worker, if profiling is active."""
+    if _active is not None:
+        start(_active.top)
+
+
+def _push(heap: list[Any], item: Any, size: int):
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    else:
+        heapq.heappushpop(heap, item)
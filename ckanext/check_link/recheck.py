@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Iterable
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+from ckan.lib.redis import connect_to_redis
+
+from .model import Report
+from .utils import resource_url
+
+log = logging.getLogger(__name__)
+
+CONFIG_ENABLED = "ckanext.check_link.recheck.enabled"
+DEFAULT_ENABLED = False
+
+CONFIG_DELAY = "ckanext.check_link.recheck.delay"
+DEFAULT_DELAY = 60
+
+CONFIG_BATCH_SIZE = "ckanext.check_link.recheck.batch_size"
+DEFAULT_BATCH_SIZE = 100
+
+# processing job is considered dead if it did not report for this number of
+# seconds in addition to the delay
+FLAG_TTL = 600
+
+# type of packages whose own URL is checked, as in check-applications command
+APPLICATION_TYPE = "application"
+
+RESOURCE_PREFIX = "resource:"
+APPLICATION_PREFIX = "application:"
+
+
+def is_enabled() -> bool:
+    return tk.asbool(tk.config.get(CONFIG_ENABLED, DEFAULT_ENABLED))
+
+
+def package_changed(pkg_dict: dict[str, Any]):
+    """Queue changed links of the package and its resources."""
+    resources = model.Session.query(
+        model.Resource.id, model.Resource.url, model.Resource.url_type
+    ).filter(
+        model.Resource.package_id == pkg_dict["id"],
+        model.Resource.state == "active",
+    )
+    resources_changed(
+        {"id": id_, "package_id": pkg_dict["id"], "url": url, "url_type": url_type}
+        for id_, url, url_type in resources
+    )
+    application_changed(pkg_dict)
+
+
+def resources_changed(resources: Iterable[dict[str, Any]]):
+    """Queue resources whose URL differs from the URL of their report.
+
+    Reports with outdated URL are removed immediately. URLs of uploaded
+    resources are compared in the qualified form, the same that is used by
+    checks.
+
+    """
+    urls = {
+        res["id"]: resource_url(
+            res["id"], res.get("package_id", ""), res.get("url"), res.get("url_type")
+        )
+        for res in resources
+    }
+    if not urls:
+        return
+
+    reports = dict(
+        model.Session.query(Report.resource_id, Report.url).filter(
+            Report.resource_id.in_(urls)
+        )
+    )
+    changed = [id_ for id_, url in urls.items() if reports.get(id_) != url]
+    if not changed:
+        return
+
+    stale = [id_ for id_ in changed if id_ in reports]
+    if stale:
+        _delete_reports({"resource_id": stale})
+
+    push(RESOURCE_PREFIX + id_ for id_ in changed if urls[id_])
+
+
+def resource_deleted(resource_id: str):
+    _delete_reports({"resource_id": [resource_id]})
+
+
+def application_changed(pkg_dict: dict[str, Any]):
+    """Queue the application if its URL has no report yet.
+
+    Reports about previous URLs of the application are removed immediately.
+
+    """
+    if pkg_dict.get("type") != APPLICATION_TYPE:
+        return
+
+    url = pkg_dict.get("url") or ""
+    reports = (
+        model.Session.query(Report.url)
+        .filter(
+            Report.resource_id.is_(None),
+            Report.details["package_id"].astext == pkg_dict["id"],
+        )
+        .all()
+    )
+
+    stale = [report_url for report_url, in reports if report_url != url]
+    if stale:
+        _delete_reports({"url": stale})
+
+    if url and len(stale) == len(reports):
+        push([APPLICATION_PREFIX + pkg_dict["id"]])
+
+
+def push(members: Iterable[str]):
+    """Add items to the queue, postponing the check of already queued items.
+
+    Every item is checked once `delay` seconds passed after its last
+    change, so a burst of updates results in a single check.
+
+    """
+    due = time.time() + tk.asint(tk.config.get(CONFIG_DELAY, DEFAULT_DELAY))
+    mapping = {member: due for member in members}
+    if not mapping:
+        return
+
+    conn = connect_to_redis()
+    conn.zadd(_queue_key(), mapping)
+    _schedule(conn)
+
+
+def process_queue():
+    """Background job that checks queued items as soon as they are due."""
+    conn = connect_to_redis()
+    delay = tk.asint(tk.config.get(CONFIG_DELAY, DEFAULT_DELAY))
+    size = tk.asint(tk.config.get(CONFIG_BATCH_SIZE, DEFAULT_BATCH_SIZE))
+    key = _queue_key()
+
+    while True:
+        conn.expire(_flag_key(), delay + FLAG_TTL)
+        now = time.time()
+        due = [
+            member.decode() if isinstance(member, bytes) else member
+            for member in conn.zrangebyscore(key, "-inf", now, start=0, num=size)
+        ]
+        if due:
+            conn.zrem(key, *due)
+            try:
+                check(due)
+            except Exception:
+                log.exception("Cannot recheck %s queued items", len(due))
+                # put items back, unless they were changed again in the
+                # meantime, and let the next change schedule a new job. The
+                # flag is released only here: on normal exit it may belong
+                # to another job
+                retry = time.time() + delay
+                conn.zadd(key, {member: retry for member in due}, nx=True)
+                conn.delete(_flag_key())
+                raise
+            continue
+
+        upcoming = conn.zrange(key, 0, 0, withscores=True)
+        if upcoming:
+            time.sleep(min(max(upcoming[0][1] - now, 0), delay))
+            continue
+
+        conn.delete(_flag_key())
+        # items queued while the flag was removed are handled by this job
+        if not conn.zcard(key) or not _acquire(conn):
+            return
+
+
+def check(members: list[str]):
+    """Check and save reports of queued resources and applications."""
+    user = tk.get_action("get_site_user")({"ignore_auth": True}, {})
+    params = {
+        "save": True,
+        "skip_invalid": True,
+        "include_drafts": True,
+        "include_private": True,
+    }
+
+    resources = [
+        m[len(RESOURCE_PREFIX) :] for m in members if m.startswith(RESOURCE_PREFIX)
+    ]
+    if resources:
+        tk.get_action("check_link_db_check")(
+            {"user": user["name"]}, dict(params, resource_ids=resources)
+        )
+
+    applications = [
+        m[len(APPLICATION_PREFIX) :] for m in members if m.startswith(APPLICATION_PREFIX)
+    ]
+    if applications:
+        tk.get_action("check_link_application_check")(
+            {"user": user["name"]},
+            dict(
+                params,
+                fq="id:({})".format(" OR ".join(applications)),
+                rows=len(applications),
+                keyset=True,
+            ),
+        )
+
+
+def _schedule(conn: Any):
+    """Start processing job, unless it's already running."""
+    if _acquire(conn):
+        tk.enqueue_job(process_queue, title="check_link: recheck changed links")
+
+
+def _acquire(conn: Any) -> bool:
+    delay = tk.asint(tk.config.get(CONFIG_DELAY, DEFAULT_DELAY))
+    return bool(conn.set(_flag_key(), 1, nx=True, ex=delay + FLAG_TTL))
+
+
+def _delete_reports(data_dict: dict[str, Any]):
+    tk.get_action("check_link_report_delete_many")({"ignore_auth": True}, data_dict)
+
+
+def _queue_key() -> str:
+    return "{}:check_link:recheck".format(tk.config.get("ckan.site_id"))
+
+
+def _flag_key() -> str:
+    return _queue_key() + ":scheduled"
@@ -0,0 +1,245 @@
+"""Fixtures of the benchmark suite.
+
+`CHECK_LINK_BENCHMARK_SIZE` controls the number of seeded items
+(10000 by default) and `CHECK_LINK_BENCHMARK_OUTPUT` is the path of the
+file that receives every result as a JSON line.
+
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+import ckan.model as model
+import pytest
+import sqlalchemy as sa
+from ckan.model.types import make_uuid
+
+from ckanext.check_link.model import Report
+
+SIZE = int(os.environ.get("CHECK_LINK_BENCHMARK_SIZE", 10000))
+OUTPUT = os.environ.get("CHECK_LINK_BENCHMARK_OUTPUT")
+
+# response time of slow endpoints
+SLOW_DELAY = 0.2
+# response time of endpoints that time out. Checks use TIMEOUT as limit
+TIMEOUT_DELAY = 3
+TIMEOUT = 1
+
+RESOURCES_PER_PACKAGE = 10
+
+# out of every 50 links: 1 times out, 4 are missing, 5 redirect, 5 are
+# slow and the rest respond immediately
+DISTRIBUTION = (
+    ["timeout"] * 1 + ["missing"] * 4 + ["redirect"] * 5 + ["slow"] * 5 + ["fast"] * 35
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Endpoint behaviour is defined by the first segment of the path.
+
+    * `/fast/...` responds with 200 immediately
+    * `/slow/...` responds with 200 after `SLOW_DELAY` seconds
+    * `/timeout/...` responds after `TIMEOUT_DELAY` seconds
+    * `/redirect/...` redirects to the same path under `/fast`
+    * `/missing/...` responds with 404
+
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def do_GET(self):
+        self._respond(True)
+
+    def _respond(self, with_body: bool):
+        kind, _sep, rest = self.path.lstrip("/").partition("/")
+        if kind == "slow":
+            time.sleep(SLOW_DELAY)
+        elif kind == "timeout":
+            time.sleep(TIMEOUT_DELAY)
+
+        if kind == "redirect":
+            self.send_response(301)
+            self.send_header("Location", "/fast/" + rest)
+        elif kind == "missing":
+            self.send_response(404)
+        else:
+            self.send_response(200)
+
+        body = b"ok"
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if with_body:
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request: Any, client_address: Any):
+        # clients drop connections of timed out requests
+        pass
+
+
+@pytest.fixture(scope="session")
+def stub_server() -> Iterator[str]:
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield "http://127.0.0.1:{}".format(server.server_address[1])
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_urls(stub_server: str):
+    def factory(size: int = SIZE) -> list[str]:
+        return [
+            "{}/{}/{}".format(stub_server, DISTRIBUTION[idx % len(DISTRIBUTION)], idx)
+            for idx in range(size)
+        ]
+
+    return factory
+
+
+@pytest.fixture
+def seed_packages():
+    """Insert packages with resources pointing to the given URLs.
+
+    Rows are inserted in bulk, bypassing actions, because creating
+    thousands of packages one by one takes longer than the benchmark.
+
+    """
+
+    def seed(urls: list[str]) -> list[str]:
+        now = datetime.utcnow()
+        packages: list[dict[str, Any]] = []
+        resources: list[dict[str, Any]] = []
+
+        for position, url in enumerate(urls):
+            if position % RESOURCES_PER_PACKAGE == 0:
+                id_ = make_uuid()
+                packages.append(
+                    {
+                        "id": id_,
+                        "name": "benchmark-" + id_,
+                        "title": "Benchmark " + id_,
+                        "type": "dataset",
+                        "state": "active",
+                        "private": False,
+                        "metadata_created": now,
+                        "metadata_modified": now,
+                    }
+                )
+
+            resources.append(
+                {
+                    "id": make_uuid(),
+                    "package_id": packages[-1]["id"],
+                    "url": url,
+                    "position": position % RESOURCES_PER_PACKAGE,
+                    "state": "active",
+                    "extras": {},
+                }
+            )
+
+        model.Session.bulk_insert_mappings(model.Package, packages)
+        model.Session.bulk_insert_mappings(model.Resource, resources)
+        model.Session.commit()
+
+        return [pkg["id"] for pkg in packages]
+
+    return seed
+
+
+@pytest.fixture
+def seed_reports():
+    """Insert free reports in different states with spread status changes."""
+
+    def seed(urls: list[str]):
+        now = datetime.utcnow()
+        states = ["available", "missing", "timeout", "moved", "error"]
+        model.Session.bulk_insert_mappings(
+            Report,
+            [
+                {
+                    "id": make_uuid(),
+                    "url": url,
+                    "state": states[idx % len(states)],
+                    "last_checked": now,
+                    "last_status_change": now - timedelta(minutes=idx),
+                    "last_available": now,
+                    "details": {"code": 200},
+                }
+                for idx, url in enumerate(urls)
+            ],
+        )
+        model.Session.commit()
+
+    return seed
+
+
+@pytest.fixture
+def measure(request: Any):
+    """Measure throughput, number of queries and peak memory of the block.
+
+    Memory is traced by `tracemalloc`, so absolute throughput is lower than
+    in production. Compare results of the same benchmark only.
+
+    """
+    reporter = request.config.pluginmanager.get_plugin("terminalreporter")
+
+    @contextlib.contextmanager
+    def measure(name: str, items: int) -> Iterator[dict[str, Any]]:
+        queries = [0]
+
+        def count(*args: Any):
+            queries[0] += 1
+
+        result: dict[str, Any] = {"name": name, "items": items}
+        sa.event.listen(model.meta.engine, "before_cursor_execute", count)
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            elapsed = time.perf_counter() - start
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            sa.event.remove(model.meta.engine, "before_cursor_execute", count)
+
+        result.update(
+            seconds=round(elapsed, 3),
+            items_per_second=round(items / elapsed, 1),
+            queries=queries[0],
+            queries_per_item=round(queries[0] / items, 3),
+            peak_memory_mib=round(peak / 2**20, 2),
+        )
+
+        if reporter:
+            reporter.write_line(
+                "{name}: {items} items in {seconds}s, {items_per_second}/s,"
+                " {queries_per_item} queries/item,"
+                " peak memory {peak_memory_mib} MiB".format(**result)
+            )
+
+        if OUTPUT:
+            with open(OUTPUT, "a") as dest:
+                dest.write(json.dumps(result) + "\n")
+
+    return measure
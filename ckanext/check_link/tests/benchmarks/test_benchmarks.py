@@ -0,0 +1,150 @@
+"""Throughput of checks and report listing at realistic scale.
+
+Run with `CHECK_LINK_BENCHMARK=1 pytest ckanext/check_link/tests/benchmarks -s`.
+
+"""
+from __future__ import annotations
+
+import os
+from collections import Counter
+from typing import Any
+
+import ckan.model as model
+import pytest
+from ckan.lib import search
+from ckan.tests.helpers import call_action
+
+from ckanext.check_link.checker import AsyncEngine, BasicEngine
+from ckanext.check_link.model import Report
+
+from .conftest import RESOURCES_PER_PACKAGE, TIMEOUT
+
+pytestmark = [
+    pytest.mark.skipif(
+        not os.environ.get("CHECK_LINK_BENCHMARK"),
+        reason="Set CHECK_LINK_BENCHMARK to run benchmarks",
+    ),
+    pytest.mark.usefixtures("with_plugins", "clean_db"),
+]
+
+BATCH_SIZE = 500
+CONCURRENCY = 100
+PAGE_SIZE = 100
+
+CHECK_PARAMS: dict[str, Any] = {
+    "concurrency": CONCURRENCY,
+    "link_patch": {"timeout": TIMEOUT},
+    "skip_invalid": True,
+}
+
+
+def _batches(items: list[Any], size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+@pytest.mark.parametrize("engine_factory", [BasicEngine, AsyncEngine])
+def test_url_check(engine_factory, make_urls, measure):
+    urls = make_urls()
+    engine = engine_factory()
+    states: Counter[str] = Counter()
+
+    with measure("url_check[{}]".format(engine_factory.__name__), len(urls)):
+        for batch in _batches(urls, BATCH_SIZE):
+            reports = call_action(
+                "check_link_url_check",
+                {"check_link_engine": engine},
+                url=batch,
+                **CHECK_PARAMS,
+            )
+            states.update(r["state"] for r in reports)
+
+    engine.close()
+    assert sum(states.values()) == len(urls)
+    assert states["missing"] and states["timeout"]
+
+
+def test_search_check(make_urls, seed_packages, measure):
+    urls = make_urls()
+    ids = seed_packages(urls)
+    search.rebuild(package_ids=ids, defer_commit=True)
+    search.commit()
+
+    engine = AsyncEngine()
+    params = dict(CHECK_PARAMS, save=True, keyset=True, rows=PAGE_SIZE)
+    checked = 0
+
+    with measure("search_check", len(urls)):
+        while True:
+            context = {"check_link_engine": engine}
+            checked += len(call_action("check_link_search_check", context, **params))
+            if context.get("check_link_package_count", 0) < PAGE_SIZE:
+                break
+            params["after"] = context["check_link_last_package"]
+
+    engine.close()
+    assert checked == len(urls)
+    assert model.Session.query(Report).count() == len(urls)
+
+
+def test_db_check(make_urls, seed_packages, measure):
+    urls = make_urls()
+    ids = seed_packages(urls)
+    engine = AsyncEngine()
+    checked = 0
+
+    with measure("db_check", len(urls)):
+        for batch in _batches(ids, BATCH_SIZE // RESOURCES_PER_PACKAGE):
+            checked += len(
+                call_action(
+                    "check_link_db_check",
+                    {"check_link_engine": engine},
+                    ids=batch,
+                    save=True,
+                    **CHECK_PARAMS,
+                )
+            )
+
+    engine.close()
+    assert checked == len(urls)
+
+
+def test_save_reports(make_urls, measure):
+    urls = make_urls()
+    states = ["available", "missing", "timeout"]
+    reports = [
+        {"url": url, "state": states[idx % len(states)], "details": {"code": 200}}
+        for idx, url in enumerate(urls)
+    ]
+
+    with measure("report_save_many", len(reports)):
+        for batch in _batches(reports, BATCH_SIZE):
+            call_action("check_link_report_save_many", reports=batch)
+
+    assert model.Session.query(Report).count() == len(reports)
+
+
+@pytest.mark.parametrize("pagination", ["cursor", "offset"])
+def test_report_search(pagination, make_urls, seed_reports, measure):
+    urls = make_urls()
+    seed_reports(urls)
+    params: dict[str, Any] = {
+        "limit": PAGE_SIZE,
+        "attached_only": False,
+        "include_count": False,
+    }
+    listed = 0
+
+    with measure("report_search[{}]".format(pagination), len(urls)):
+        while True:
+            page = call_action("check_link_report_search", **params)
+            listed += len(page["results"])
+            if len(page["results"]) < PAGE_SIZE:
+                break
+
+            if pagination == "cursor":
+                params["after"] = page["next"]
+            else:
+                params["offset"] = listed
+
+    assert listed == len(urls)
@@ -1,5 +1,7 @@
+from datetime import datetime
 from unittest.mock import ANY
 
+import ckan.model as model
 import ckan.plugins.toolkit as tk
 import pytest
 from pytest_httpx import HTTPXMock
@@ -7,6 +9,11 @@ from pytest_httpx import HTTPXMock
 # from aioresponses import aioresponses
 from ckan.tests.helpers import call_action
 
+from ckanext.check_link.checker import AsyncEngine
+from ckanext.check_link.logic.action.check import make_engine
+from ckanext.check_link.model import Report
+from ckanext.check_link.utils import CheckMemo
+
 
 @pytest.fixture
 def rmock(httpx_mock):
@@ -43,6 +50,117 @@ class TestUrl:
             },
         ]
 
+    def test_duplicates_checked_once(self, faker, rmock):
+        url = faker.url()
+        rmock.add_response(url=url, status_code=200, method="HEAD")
+
+        result = call_action("check_link_url_check", url=[url, url])
+
+        assert len(rmock.get_requests()) == 1
+        assert [r["url"] for r in result] == [url, url]
+        assert result[0] == result[1]
+
+    def test_memo_reused_between_calls(self, faker, rmock):
+        url = faker.url()
+        rmock.add_response(url=url, status_code=200, method="HEAD")
+        memo = CheckMemo()
+        context = {"check_link_memo": memo}
+
+        first = call_action("check_link_url_check", context.copy(), url=url)
+        second = call_action("check_link_url_check", context.copy(), url=url)
+
+        assert len(rmock.get_requests()) == 1
+        assert first == second
+        assert memo.hits == 1
+
+    @pytest.mark.ckan_config("ckanext.check_link.check.engine", "async")
+    def test_shared_async_engine(self, faker, rmock):
+        urls = [faker.url(), faker.url()]
+        for url in urls:
+            rmock.add_response(url=url, status_code=200, method="HEAD")
+        engine = make_engine()
+        context = {"check_link_engine": engine}
+
+        try:
+            for url in urls:
+                result = call_action("check_link_url_check", context.copy(), url=url)
+                assert result[0]["state"] == "available"
+        finally:
+            engine.close()
+
+        assert isinstance(engine, AsyncEngine)
+        assert len(rmock.get_requests()) == 2
+
+    def test_conditional_revalidation(self, faker, rmock):
+        url = faker.url()
+        rmock.add_response(
+            url=url, status_code=200, method="HEAD", headers={"ETag": '"v1"'}
+        )
+        call_action("check_link_url_check", url=url, save=True)
+        report = call_action("check_link_report_show", url=url)
+        assert report["details"]["etag"] == '"v1"'
+
+        rmock.add_response(
+            url=url,
+            status_code=304,
+            method="HEAD",
+            match_headers={"If-None-Match": '"v1"'},
+        )
+        result = call_action("check_link_url_check", url=url)
+
+        assert result[0]["state"] == "available"
+        assert result[0]["code"] == 304
+        assert result[0]["etag"] == '"v1"'
+
+    def test_newest_validators_used(self, faker, rmock, report_factory):
+        url = faker.url()
+        old = report_factory(url=url)
+        new = report_factory(url=url)
+        for report, etag, checked in [
+            (old, '"old"', datetime(2000, 1, 1)),
+            (new, '"new"', datetime.utcnow()),
+        ]:
+            model.Session.query(Report).filter(Report.id == report["id"]).update(
+                {"details": {"etag": etag}, "last_checked": checked},
+                synchronize_session=False,
+            )
+        model.Session.commit()
+
+        rmock.add_response(
+            url=url,
+            status_code=304,
+            method="HEAD",
+            match_headers={"If-None-Match": '"new"'},
+        )
+        result = call_action("check_link_url_check", url=url)
+        assert result[0]["code"] == 304
+
+    def test_fresh_reports_reused(self, faker, rmock):
+        url = faker.url()
+        rmock.add_response(url=url, status_code=404, method="HEAD")
+        call_action("check_link_url_check", url=url, save=True)
+        report = call_action("check_link_report_show", url=url)
+
+        result = call_action("check_link_url_check", url=url, max_age=3600, save=True)
+
+        assert len(rmock.get_requests()) == 1
+        assert result[0]["state"] == "missing"
+        assert result[0]["code"] == 404
+        assert call_action("check_link_report_show", url=url) == report
+
+    def test_fresh_reports_are_not_memo_hits(self, faker, rmock):
+        url = faker.url()
+        rmock.add_response(url=url, status_code=404, method="HEAD")
+        call_action("check_link_url_check", url=url, save=True)
+        memo = CheckMemo()
+
+        call_action(
+            "check_link_url_check", {"check_link_memo": memo}, url=url, max_age=3600
+        )
+
+        assert memo.hits == 0
+        assert memo.skipped == 1
+
     def test_not_saved_by_defaut(self, faker, rmock):
         url = faker.url()
 
@@ -106,6 +224,82 @@ class TestPackage:
         assert len(result) == 1
         assert result[0]["code"] == 200
 
+    def test_shared_url_checked_once(self, resource_factory, rmock, package):
+        first = resource_factory(package_id=package["id"])
+        second = resource_factory(package_id=package["id"], url=first["url"])
+        rmock.add_response(url=first["url"], status_code=200, method="HEAD")
+
+        result = call_action("check_link_package_check", id=package["id"])
+
+        assert len(rmock.get_requests()) == 1
+        assert {r["resource_id"] for r in result} == {first["id"], second["id"]}
+
     def test_empty(self, package):
         result = call_action("check_link_package_check", id=package["id"])
         assert result == []
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestSearch:
+    def test_keyset_pagination(self, resource_factory, rmock, monkeypatch):
+        monkeypatch.setattr(
+            "ckanext.check_link.logic.action.check.SEARCH_PAGE_SIZE", 1
+        )
+        resources = [resource_factory() for _ in range(3)]
+        for resource in resources:
+            rmock.add_response(url=resource["url"], status_code=200, method="HEAD")
+
+        result = call_action("check_link_search_check", keyset=True, rows=3)
+
+        assert sorted(r["resource_id"] for r in result) == sorted(
+            r["id"] for r in resources
+        )
+
+    def test_keyset_after(self, resource_factory, rmock):
+        resources = sorted(
+            (resource_factory() for _ in range(2)), key=lambda r: r["package_id"]
+        )
+        rmock.add_response(url=resources[1]["url"], status_code=200, method="HEAD")
+
+        result = call_action(
+            "check_link_search_check", keyset=True, after=resources[0]["package_id"]
+        )
+
+        assert [r["resource_id"] for r in result] == [resources[1]["id"]]
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestDb:
+    def test_basic(self, resource_factory, rmock, package):
+        resource = resource_factory(package_id=package["id"])
+        rmock.add_response(url=resource["url"], status_code=200, method="HEAD")
+
+        result = call_action("check_link_db_check", ids=[package["name"]])
+
+        assert len(result) == 1
+        assert result[0]["resource_id"] == resource["id"]
+        assert result[0]["package_id"] == package["id"]
+        assert result[0]["code"] == 200
+
+    def test_uploaded_resource(self, resource_factory, rmock, package):
+        resource = resource_factory(
+            package_id=package["id"], url="data.csv", url_type="upload"
+        )
+        rmock.add_response(url=resource["url"], status_code=200, method="HEAD")
+
+        result = call_action(
+            "check_link_db_check", resource_ids=[resource["id"]], skip_invalid=True
+        )
+
+        assert len(result) == 1
+        assert result[0]["url"] == resource["url"]
+        assert result[0]["code"] == 200
+
+    def test_private_skipped_by_default(
+        self, package_factory, resource_factory, organization
+    ):
+        package = package_factory(private=True, owner_org=organization["id"])
+        resource_factory(package_id=package["id"])
+
+        result = call_action("check_link_db_check", ids=[package["id"]])
+        assert result == []
@@ -0,0 +1,91 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+import pytest
+from ckan.tests.helpers import call_action
+
+from ckanext.check_link import history
+from ckanext.check_link.model import Host, HostRollup, LinkRollup, TrackedUrl
+from ckanext.check_link.utils import normalize_url
+
+
+@pytest.mark.ckan_config("ckanext.check_link.history.enabled", True)
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestUptime:
+    def test_checks_recorded(self, faker, httpx_mock):
+        url = faker.url()
+        httpx_mock.add_response(url=url, status_code=200, method="HEAD")
+        httpx_mock.add_response(url=url, status_code=404, method="HEAD")
+
+        call_action("check_link_url_check", url=url)
+        call_action("check_link_url_check", url=url)
+
+        result = call_action("check_link_link_uptime", url=url)
+        assert result["checks"] == 2
+        assert result["available"] == 1
+        assert result["uptime"] == 0.5
+        assert len(result["days"]) == 1
+
+        host = call_action("check_link_link_uptime", host=urlsplit(url).hostname)
+        assert host["checks"] == 2
+
+    def test_duplicate_not_counted(self, faker):
+        url = normalize_url(faker.url())
+        link = SimpleNamespace(
+            state=SimpleNamespace(name="available"), code=200, elapsed=0.1
+        )
+        checked_at = datetime.utcnow()
+        for _ in range(2):
+            history.record(model.Session, {url: link}, checked_at)
+        model.Session.commit()
+
+        result = call_action("check_link_link_uptime", url=url)
+        assert result["checks"] == 1
+
+    def test_unknown_url(self, faker):
+        with pytest.raises(tk.ObjectNotFound):
+            call_action("check_link_link_uptime", url=faker.url())
+
+
+@pytest.mark.ckan_config("ckanext.check_link.history.retention", 0)
+@pytest.mark.ckan_config("ckanext.check_link.history.enabled", True)
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestPrune:
+    def test_prune(self, faker, httpx_mock):
+        url = faker.url()
+        httpx_mock.add_response(url=url, status_code=200, method="HEAD")
+        call_action("check_link_url_check", url=url)
+
+        result = call_action("check_link_history_prune")
+        assert result == {
+            "history": 1,
+            "link_rollups": 0,
+            "host_rollups": 0,
+            "urls": 0,
+            "hosts": 0,
+        }
+
+    @pytest.mark.ckan_config("ckanext.check_link.history.rollup_retention", 1)
+    def test_unreferenced_urls_and_hosts(self, faker, httpx_mock):
+        url = faker.url()
+        httpx_mock.add_response(url=url, status_code=200, method="HEAD")
+        call_action("check_link_url_check", url=url)
+
+        day = date.today() - timedelta(days=2)
+        for table in [LinkRollup, HostRollup]:
+            model.Session.query(table).update({"day": day})
+        model.Session.commit()
+
+        result = call_action("check_link_history_prune")
+        assert result == {
+            "history": 1,
+            "link_rollups": 1,
+            "host_rollups": 1,
+            "urls": 1,
+            "hosts": 1,
+        }
+        assert not model.Session.query(TrackedUrl).count()
+        assert not model.Session.query(Host).count()
@@ -1,5 +1,10 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
 import ckan.plugins.toolkit as tk
 import pytest
+from ckan.lib import mailer
 from ckan.tests.helpers import call_action
 
 
@@ -67,6 +72,118 @@ class TestSave:
         assert updated["state"] == "updated"
 
 
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestSaveMany:
+    def test_create_and_update(self, resource, report_factory, faker):
+        existing = report_factory(resource_id=resource["id"], state="available")
+        free_url = faker.url()
+
+        result = call_action(
+            "check_link_report_save_many",
+            reports=[
+                {
+                    "url": existing["url"],
+                    "resource_id": resource["id"],
+                    "state": "missing",
+                },
+                {"url": free_url, "state": "available", "code": 200},
+            ],
+        )
+        assert result == {"saved": 2, "deleted": 0}
+
+        updated = call_action("check_link_report_show", resource_id=resource["id"])
+        assert updated["id"] == existing["id"]
+        assert updated["state"] == "missing"
+        assert updated["last_available"] == existing["last_checked"]
+        assert updated["last_status_change"] > existing["last_status_change"]
+
+        free = call_action("check_link_report_show", url=free_url)
+        assert free["state"] == "available"
+        assert free["details"]["code"] == 200
+
+    def test_same_state_keeps_status_change(self, report_factory):
+        report = report_factory(resource_id=None, state="missing")
+
+        call_action(
+            "check_link_report_save_many",
+            reports=[{"url": report["url"], "state": "missing"}],
+        )
+
+        updated = call_action("check_link_report_show", id=report["id"])
+        assert updated["last_status_change"] == report["last_status_change"]
+        assert updated["last_checked"] > report["last_checked"]
+
+    @pytest.mark.ckan_config("ckanext.check_link.schedule.min_interval", "600")
+    def test_next_check_scheduled(self, report_factory):
+        report = report_factory(resource_id=None, state="missing")
+        assert report["next_check_at"] > report["last_checked"]
+
+        call_action(
+            "check_link_report_save_many",
+            reports=[{"url": report["url"], "state": "available"}],
+        )
+
+        updated = call_action("check_link_report_show", id=report["id"])
+        assert updated["next_check_at"] > updated["last_checked"]
+
+    @pytest.mark.ckan_config("ckanext.check_link.schedule.min_interval", "7200")
+    @pytest.mark.ckan_config("ckanext.check_link.schedule.max_interval", "86400")
+    @pytest.mark.ckan_config(
+        "ckanext.check_link.schedule.max_broken_interval", "3600"
+    )
+    def test_interval_limited_by_state(self, report_factory):
+        """Upsert expressions are compatible with SQLAlchemy 1.3 and 1.4."""
+        available = report_factory(resource_id=None, state="missing")
+        broken = report_factory(resource_id=None, state="available")
+
+        call_action(
+            "check_link_report_save_many",
+            reports=[
+                {"url": available["url"], "state": "available"},
+                {"url": broken["url"], "state": "missing"},
+            ],
+        )
+
+        for report, interval in [(available, 7200), (broken, 3600)]:
+            updated = call_action("check_link_report_show", id=report["id"])
+            assert updated["last_status_change"] == updated["last_checked"]
+            next_check_at = datetime.fromisoformat(updated["next_check_at"])
+            last_checked = datetime.fromisoformat(updated["last_checked"])
+            assert next_check_at - last_checked == timedelta(seconds=interval)
+
+    def test_resource_id_must_be_real(self, faker):
+        with pytest.raises(tk.ValidationError):
+            call_action(
+                "check_link_report_save_many",
+                reports=[
+                    {
+                        "url": faker.url(),
+                        "state": "unknown",
+                        "resource_id": faker.uuid4(),
+                    }
+                ],
+            )
+
+    def test_clear_available(self, report_factory):
+        report = report_factory(state="missing")
+
+        result = call_action(
+            "check_link_report_save_many",
+            reports=[
+                {
+                    "url": report["url"],
+                    "resource_id": report["resource_id"],
+                    "state": "available",
+                }
+            ],
+            clear_available=True,
+        )
+        assert result == {"saved": 0, "deleted": 1}
+
+        with pytest.raises(tk.ObjectNotFound):
+            call_action("check_link_report_show", id=report["id"])
+
+
 @pytest.mark.usefixtures("with_plugins", "clean_db")
 class TestShow:
     def test_shown_by_id(self, report):
@@ -106,6 +223,27 @@ class TestDelete:
             assert call_action("check_link_report_show", id=report["id"])
 
 
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestDeleteMany:
+    def test_delete_many(self, report_factory):
+        by_id, by_resource, _kept = report_factory.create_batch(3)
+        free = report_factory(resource_id=None)
+
+        result = call_action(
+            "check_link_report_delete_many",
+            id=[by_id["id"]],
+            resource_id=[by_resource["resource_id"]],
+            url=[free["url"]],
+        )
+
+        assert result == {"deleted": 3}
+        assert call_action("check_link_report_search")["count"] == 1
+
+    def test_filter_required(self):
+        with pytest.raises(tk.ValidationError):
+            call_action("check_link_report_delete_many")
+
+
 @pytest.mark.usefixtures("with_plugins", "clean_db")
 class TestSearch:
     def test_limit(self, report_factory):
@@ -118,3 +256,108 @@ class TestSearch:
         result = call_action("check_link_report_search", limit=5, offset=8)
         assert result["count"] == 10
         assert len(result["results"]) == 2
+
+    def test_cursor(self, report_factory):
+        report_factory.create_batch(5)
+
+        first = call_action("check_link_report_search", limit=3)
+        second = call_action(
+            "check_link_report_search", limit=3, after=first["next"]
+        )
+
+        ids = [r["id"] for r in first["results"] + second["results"]]
+        assert len(set(ids)) == 5
+        assert "next" not in second
+
+    def test_invalid_cursor(self):
+        with pytest.raises(tk.ValidationError):
+            call_action("check_link_report_search", after="not-a-cursor")
+
+    def test_details(self, report_factory, resource):
+        report_factory(resource_id=resource["id"])
+
+        result = call_action("check_link_report_search")
+        details = result["results"][0]["details"]
+        assert details["resource"]["id"] == resource["id"]
+        assert details["package"]["id"] == resource["package_id"]
+
+    def test_fields(self, report_factory):
+        report = report_factory()
+
+        result = call_action("check_link_report_search", fields=["id", "state"])
+        assert result["results"] == [{"id": report["id"], "state": "available"}]
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestStats:
+    def test_group_by_state(self, report_factory):
+        report_factory.create_batch(2)
+        report_factory(state="missing")
+
+        result = call_action("check_link_report_stats", fresh=True)
+
+        assert result["total"] == 3
+        assert sorted(result["groups"], key=lambda g: g["count"]) == [
+            {"state": "missing", "count": 1},
+            {"state": "available", "count": 2},
+        ]
+
+    def test_group_by_host(self, report_factory):
+        report_factory(url="https://Example.com/a", resource_id=None)
+        report_factory(url="https://example.com:8080/b", resource_id=None)
+
+        result = call_action(
+            "check_link_report_stats", group_by=["host", "state"], fresh=True
+        )
+        assert result["groups"] == [
+            {"host": "example.com", "state": "available", "count": 2}
+        ]
+
+    def test_unknown_dimension(self):
+        with pytest.raises(tk.ValidationError):
+            call_action("check_link_report_stats", group_by="color")
+
+
+@pytest.mark.ckan_config("ckanext.check_link.email_to", "admin@example.com")
+@pytest.mark.ckan_config("ckanext.check_link.email.max_rows", 1)
+@pytest.mark.usefixtures("with_plugins", "clean_db", "with_request_context")
+class TestEmailReport:
+    def test_email(self, report_factory, monkeypatch):
+        report_factory()
+        broken = report_factory.create_batch(2, state="missing")
+        sent = []
+
+        def mail_recipient(
+            recipient_name,
+            recipient_email,
+            subject,
+            body,
+            body_html=None,
+            headers=None,
+            attachments=None,
+        ):
+            sent.append(
+                {
+                    "recipient_email": recipient_email,
+                    "body": body,
+                    "attachments": [
+                        (name, content.read(), media_type)
+                        for name, content, media_type in attachments
+                    ],
+                }
+            )
+
+        monkeypatch.setattr(mailer, "mail_recipient", mail_recipient)
+        call_action("check_link_email_report")
+
+        assert len(sent) == 1
+        mail = sent[0]
+        assert mail["recipient_email"] == "admin@example.com"
+        assert mail["body"].startswith("2 unavailable resources found")
+        assert mail["body"].count("Broken link: ") == 1
+
+        [(name, content, media_type)] = mail["attachments"]
+        assert name == "broken-links.csv"
+        assert media_type == "text/csv"
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        assert {row["url"] for row in rows} == {r["url"] for r in broken}
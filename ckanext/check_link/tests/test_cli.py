@@ -0,0 +1,217 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+import pytest
+from ckan.tests.helpers import call_action
+from click.testing import CliRunner
+
+from ckanext.check_link.cli import check_link
+from ckanext.check_link.model import Report, Run
+
+
+def _runner() -> CliRunner:
+    try:
+        return CliRunner(mix_stderr=False)
+    except TypeError:
+        # click>=8.2 always keeps stderr separately
+        return CliRunner()
+
+
+def _invoke(*args: str):
+    result = _runner().invoke(check_link, list(args))
+    assert result.exit_code == 0, result.output
+    return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.server.requested.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """Real HTTP server, reachable from forked worker processes.
+
+    Mocked transport of `httpx_mock` does not report requests made by
+    forked processes back to the test.
+
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.requested = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def _read_results(path) -> list[dict]:
+    with open(path) as src:
+        return [json.loads(line) for line in src]
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestCheckResources:
+    def test_uploaded_resource(self, resource_factory, httpx_mock):
+        resource = resource_factory(url="data.csv", url_type="upload")
+        assert resource["url"].endswith(
+            "/dataset/{}/resource/{}/download/data.csv".format(
+                resource["package_id"], resource["id"]
+            )
+        )
+        httpx_mock.add_response(url=resource["url"], method="HEAD", status_code=200)
+
+        _invoke("check-resources", resource["id"])
+
+        report = call_action("check_link_report_show", resource_id=resource["id"])
+        assert report["url"] == resource["url"]
+        assert report["state"] == "available"
+
+    def test_resume(self, resource_factory, httpx_mock):
+        resources = sorted(
+            (resource_factory() for _ in range(3)), key=lambda r: r["id"]
+        )
+        run = Run(
+            command="check-resources",
+            params={"ids": [], "ignore_local_resources": False, "due": False},
+            checkpoint=resources[0]["id"],
+            processed=1,
+            stats={"available": 1},
+        )
+        model.Session.add(run)
+        model.Session.commit()
+
+        for resource in resources[1:]:
+            httpx_mock.add_response(
+                url=resource["url"], method="HEAD", status_code=200
+            )
+
+        result = _invoke("check-resources", "--resume")
+        assert "Resuming run {}".format(run.id) in result.output
+
+        model.Session.refresh(run)
+        assert run.state == "finished"
+        assert run.processed == 3
+        assert run.stats == {"available": 3}
+
+        with pytest.raises(tk.ObjectNotFound):
+            call_action("check_link_report_show", resource_id=resources[0]["id"])
+        for resource in resources[1:]:
+            report = call_action("check_link_report_show", resource_id=resource["id"])
+            assert report["state"] == "available"
+
+    def test_output_file(self, resource_factory, httpx_mock, tmp_path):
+        resources = [resource_factory() for _ in range(2)]
+        for resource in resources:
+            httpx_mock.add_response(
+                url=resource["url"], method="HEAD", status_code=200
+            )
+        output = tmp_path / "results.jsonl"
+
+        result = _invoke("check-resources", f"--output={output}")
+        assert "Done" in result.output
+
+        results = _read_results(output)
+        assert {r["resource_id"] for r in results} == {r["id"] for r in resources}
+        assert {r["state"] for r in results} == {"available"}
+
+    def test_output_stdout(self, resource_factory, httpx_mock):
+        resource = resource_factory()
+        httpx_mock.add_response(url=resource["url"], method="HEAD", status_code=200)
+
+        result = _invoke("check-resources", "--output=-")
+
+        [line] = result.stdout.splitlines()
+        assert json.loads(line)["resource_id"] == resource["id"]
+        assert "Done" in result.stderr
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestCheckPackages:
+    @pytest.fixture
+    def resources(self, package_factory, resource_factory, server):
+        base = "http://127.0.0.1:{}".format(server.server_address[1])
+        return [
+            resource_factory(package_id=package_factory()["id"], url=f"{base}/{idx}")
+            for idx in range(6)
+        ]
+
+    def test_shards(self, resources, server, tmp_path):
+        checked = []
+        for index in range(3):
+            output = tmp_path / f"shard-{index}.jsonl"
+            _invoke(
+                "check-packages",
+                "--source=db",
+                f"--shard={index}/3",
+                f"--output={output}",
+            )
+            checked.append({r["resource_id"] for r in _read_results(output)})
+
+        assert sum(len(ids) for ids in checked) == len(resources)
+        assert set().union(*checked) == {r["id"] for r in resources}
+        assert len(server.requested) == len(resources)
+
+    def test_workers(self, resources, server, tmp_path):
+        output = tmp_path / "results.jsonl"
+        _invoke("check-packages", "--source=db", "--workers=2", f"--output={output}")
+
+        results = _read_results(output)
+        assert sorted(r["resource_id"] for r in results) == sorted(
+            r["id"] for r in resources
+        )
+        assert {r["state"] for r in results} == {"available"}
+        assert sorted(server.requested) == sorted(f"/{idx}" for idx in range(6))
+
+        for resource in resources:
+            report = call_action("check_link_report_show", resource_id=resource["id"])
+            assert report["state"] == "available"
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestPurge:
+    def test_purge_orphans(self, report_factory, resource_factory):
+        kept = report_factory()
+        free = report_factory(resource_id=None)
+        orphans = [
+            report_factory(resource_id=resource_factory()["id"]) for _ in range(3)
+        ]
+        for report in orphans:
+            call_action("resource_delete", id=report["resource_id"])
+
+        result = _invoke("purge-reports", "--orphans-only", "--dry-run")
+        assert "Reports to delete: 3" in result.output
+        assert model.Session.query(Report).count() == 5
+
+        _invoke("purge-reports", "--orphans-only", "--batch-size=2")
+        assert {id_ for id_, in model.Session.query(Report.id)} == {
+            kept["id"],
+            free["id"],
+        }
+
+    def test_purge_stale_applications(self, report_factory):
+        fresh = report_factory(resource_id=None)
+        stale = [report_factory(resource_id=None) for _ in range(3)]
+        model.Session.query(Report).filter(
+            Report.id.in_([r["id"] for r in stale])
+        ).update({"last_checked": datetime(2000, 1, 1)}, synchronize_session=False)
+        model.Session.commit()
+
+        _invoke("purge-stale-applications", "2010-01-01", "--dry-run")
+        assert model.Session.query(Report).count() == 4
+
+        _invoke("purge-stale-applications", "2010-01-01", "--batch-size=2")
+        assert [id_ for id_, in model.Session.query(Report.id)] == [fresh["id"]]
@@ -0,0 +1,20 @@
+import pytest
+
+from ckanext.check_link import helpers
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db")
+class TestPackageTitles:
+    def test_titles(self, package_factory):
+        helpers._titles.clear()
+        first = package_factory(title="First")
+        second = package_factory(title="Second")
+
+        titles = helpers.get_package_titles([first["id"], second["id"], "missing"])
+        assert titles == {first["id"]: "First", second["id"]: "Second"}
+
+    def test_cached(self, package):
+        helpers._titles.clear()
+        assert helpers.get_package_title(package["id"]) == package["title"]
+        helpers._titles.set(package["id"], "Cached")
+        assert helpers.get_package_title(package["id"]) == "Cached"
@@ -0,0 +1,79 @@
+import ckan.plugins.toolkit as tk
+import pytest
+from ckan.lib import jobs
+from ckan.tests.helpers import call_action
+from rq import SimpleWorker
+
+
+def _run_jobs():
+    queue = jobs.get_queue()
+    SimpleWorker([queue], connection=queue.connection).work(burst=True)
+
+
+@pytest.mark.ckan_config("ckanext.check_link.job.batch_size", 1)
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_redis")
+class TestAsyncCheck:
+    def test_url_check(self, faker, httpx_mock):
+        urls = [faker.url(), faker.url()]
+        for url in urls:
+            httpx_mock.add_response(url=url, status_code=200, method="HEAD")
+
+        result = call_action("check_link_url_check", url=urls, **{"async": True})
+        status = call_action("check_link_job_status", id=result["job_id"])
+        assert status["status"] == "queued"
+        assert status["processed"] == 0
+
+        _run_jobs()
+
+        status = call_action("check_link_job_status", id=result["job_id"])
+        assert status["status"] == "finished"
+        assert status["total"] == 2
+        assert status["processed"] == 2
+        assert status["stats"] == {"available": 2}
+        assert [r["url"] for r in status["reports"]] == urls
+
+    def test_search_check(self, resource_factory, httpx_mock):
+        resources = [resource_factory() for _ in range(3)]
+        for resource in resources:
+            httpx_mock.add_response(
+                url=resource["url"], status_code=200, method="HEAD"
+            )
+
+        result = call_action("check_link_search_check", **{"async": True})
+        _run_jobs()
+
+        status = call_action("check_link_job_status", id=result["job_id"])
+        assert status["processed"] == 3
+        assert {r["resource_id"] for r in status["reports"]} == {
+            r["id"] for r in resources
+        }
+
+    def test_search_check_respects_rows(self, resource_factory, httpx_mock):
+        resources = [resource_factory() for _ in range(3)]
+        checked = sorted(resources, key=lambda r: r["package_id"])[:2]
+        for resource in checked:
+            httpx_mock.add_response(
+                url=resource["url"], status_code=200, method="HEAD"
+            )
+
+        result = call_action(
+            "check_link_search_check", rows=2, keyset=True, **{"async": True}
+        )
+        _run_jobs()
+
+        status = call_action("check_link_job_status", id=result["job_id"])
+        assert status["processed"] == 2
+        assert {r["resource_id"] for r in status["reports"]} == {
+            r["id"] for r in checked
+        }
+
+    def test_status_requires_user(self, faker):
+        result = call_action(
+            "check_link_url_check", url=[faker.url()], **{"async": True}
+        )
+        with pytest.raises(tk.NotAuthorized):
+            call_action(
+                "check_link_job_status",
+                {"user": "", "ignore_auth": False},
+                id=result["job_id"],
+            )
@@ -0,0 +1,73 @@
+import pytest
+from ckan.tests.helpers import call_action
+
+from ckanext.check_link import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+
+class TestRegistry:
+    def test_counter(self, registry):
+        counter = registry.register(metrics.Counter("hits", "Hits", ("host",)))
+        counter.inc(host='a"b')
+        counter.inc(2, host='a"b')
+
+        assert registry.render() == (
+            "# HELP hits Hits\n"
+            "# TYPE hits counter\n"
+            'hits{host="a\\"b"} 3\n'
+        )
+
+    def test_histogram(self, registry):
+        histogram = registry.register(
+            metrics.Histogram("duration", "Duration", buckets=(1, 5))
+        )
+        histogram.observe(0.5)
+        histogram.observe(3)
+        histogram.observe(10)
+
+        lines = registry.render().splitlines()
+        assert 'duration_bucket{le="1"} 1' in lines
+        assert 'duration_bucket{le="5"} 2' in lines
+        assert 'duration_bucket{le="+Inf"} 3' in lines
+        assert "duration_sum 13.5" in lines
+        assert "duration_count 3" in lines
+
+    def test_pop_and_merge(self, registry):
+        counter = registry.register(metrics.Counter("hits", "Hits"))
+        gauge = registry.register(metrics.Gauge("busy", "Busy"))
+        counter.inc()
+        gauge.set(5)
+
+        samples = registry.pop()
+        assert counter.snapshot() == {}
+
+        registry.merge(samples)
+        registry.merge(samples)
+        assert counter.snapshot() == {(): 2}
+        assert gauge.snapshot() == {}
+
+
+@pytest.mark.ckan_config(metrics.CONFIG_ENABLED, True)
+@pytest.mark.usefixtures("with_plugins")
+class TestCollection:
+    def test_url_check(self, faker, httpx_mock):
+        metrics.registry.clear()
+        url = faker.url()
+        httpx_mock.add_response(url=url, status_code=404, method="HEAD")
+
+        call_action("check_link_url_check", url=[url])
+
+        assert metrics.links_checked.snapshot() == {("missing",): 1}
+        assert ("http",) in metrics.phase_duration.snapshot()
+
+    def test_endpoint_requires_sysadmin(self, app):
+        app.get("/check-link/metrics", status=403)
+
+
+@pytest.mark.usefixtures("with_plugins")
+def test_endpoint_disabled(app):
+    app.get("/check-link/metrics", status=404)
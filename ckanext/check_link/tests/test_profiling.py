@@ -0,0 +1,65 @@
+from ckanext.check_link import metrics, profiling
+
+
+class TestProfile:
+    def test_slowest_links(self):
+        profile = profiling.Profile(top=2)
+        profile.add_link("http://a.com/1", "a.com", 0.5)
+        profile.add_link("http://a.com/2", "a.com", 3)
+        profile.add_link("http://b.com", "b.com", 1)
+
+        data = profile.as_dict()
+        assert [link["url"] for link in data["slowest_urls"]] == [
+            "http://a.com/2",
+            "http://b.com",
+        ]
+        assert data["slowest_hosts"][0] == {
+            "host": "a.com",
+            "links": 2,
+            "seconds": 3.5,
+            "average": 1.75,
+            "max": 3,
+        }
+
+    def test_queries_per_chunk(self):
+        profile = profiling.Profile()
+        profile.add_query()
+        profile.chunk_done(10)
+        for _ in range(3):
+            profile.add_query()
+        profile.chunk_done(5)
+
+        queries = profile.as_dict()["queries"]
+        assert queries["total"] == 4
+        assert queries["per_chunk"] == 2
+        assert queries["busiest_chunks"][0]["chunk"] == 2
+
+    def test_merge_worker_data(self):
+        worker = profiling.Profile()
+        worker.add_phase("http", 2)
+        worker.add_query()
+
+        profile = profiling.Profile()
+        profile.add_phase("http", 1)
+        profile.merge(worker.pop())
+        profile.chunk_done(1)
+
+        data = profile.as_dict()
+        assert data["phases"]["http"] == {"count": 2, "seconds": 3}
+        assert data["queries"]["total"] == 1
+        assert worker.as_dict()["phases"] == {}
+
+
+def test_phase_recorded_only_when_active():
+    with metrics.phase("search"):
+        pass
+    assert profiling.active() is None
+
+    profile = profiling.start()
+    try:
+        with metrics.phase("search"):
+            pass
+    finally:
+        profiling.stop()
+
+    assert profile.phases["search"][0] == 1
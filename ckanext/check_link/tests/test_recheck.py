@@ -0,0 +1,88 @@
+import ckan.plugins.toolkit as tk
+import pytest
+from ckan.lib.redis import connect_to_redis
+from ckan.tests.helpers import call_action
+
+from ckanext.check_link import recheck
+
+
+def _queued():
+    conn = connect_to_redis()
+    return {
+        member.decode() if isinstance(member, bytes) else member
+        for member in conn.zrange(recheck._queue_key(), 0, -1)
+    }
+
+
+@pytest.mark.ckan_config(recheck.CONFIG_ENABLED, True)
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_redis")
+class TestRecheck:
+    def test_new_resource_queued(self, resource_factory):
+        resource = resource_factory()
+        assert recheck.RESOURCE_PREFIX + resource["id"] in _queued()
+
+    def test_changed_url_invalidates_report(self, resource_factory, report_factory):
+        resource = resource_factory()
+        report_factory(resource_id=resource["id"], url=resource["url"])
+        connect_to_redis().delete(recheck._queue_key())
+
+        call_action("resource_patch", id=resource["id"], name="new name")
+        assert _queued() == set()
+        assert call_action("check_link_report_show", resource_id=resource["id"])
+
+        call_action("resource_patch", id=resource["id"], url="http://example.com/new")
+        assert _queued() == {recheck.RESOURCE_PREFIX + resource["id"]}
+        with pytest.raises(tk.ObjectNotFound):
+            call_action("check_link_report_show", resource_id=resource["id"])
+
+    def test_uploaded_resource_kept(self, package, resource_factory, report_factory):
+        resource = resource_factory(
+            package_id=package["id"], url="data.csv", url_type="upload"
+        )
+        report_factory(resource_id=resource["id"], url=resource["url"])
+        connect_to_redis().delete(recheck._queue_key())
+
+        call_action("package_patch", id=package["id"], notes="new notes")
+        call_action("resource_patch", id=resource["id"], name="new name")
+
+        assert _queued() == set()
+        report = call_action("check_link_report_show", resource_id=resource["id"])
+        assert report["url"] == resource["url"]
+
+    def test_deleted_resource(self, resource_factory, report_factory):
+        resource = resource_factory()
+        report_factory(resource_id=resource["id"], url=resource["url"])
+
+        call_action("resource_delete", id=resource["id"])
+        with pytest.raises(tk.ObjectNotFound):
+            call_action("check_link_report_show", resource_id=resource["id"])
+
+    def test_check(self, resource_factory, httpx_mock):
+        resource = resource_factory()
+        httpx_mock.add_response(url=resource["url"], status_code=404, method="HEAD")
+
+        recheck.check([recheck.RESOURCE_PREFIX + resource["id"]])
+        report = call_action("check_link_report_show", resource_id=resource["id"])
+        assert report["state"] == "missing"
+
+    def test_failed_check_keeps_items(self, monkeypatch):
+        conn = connect_to_redis()
+        member = recheck.RESOURCE_PREFIX + "resource-id"
+        conn.zadd(recheck._queue_key(), {member: 0})
+        assert recheck._acquire(conn)
+
+        def check(members):
+            raise RuntimeError("engine is broken")
+
+        monkeypatch.setattr(recheck, "check", check)
+        with pytest.raises(RuntimeError):
+            recheck.process_queue()
+
+        assert _queued() == {member}
+        assert not conn.exists(recheck._flag_key())
+
+
+@pytest.mark.usefixtures("with_plugins", "clean_db", "clean_redis")
+def test_disabled_by_default(resource_factory):
+    resource_factory()
+    assert _queued() == set()
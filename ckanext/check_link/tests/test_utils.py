@@ -0,0 +1,41 @@
+import pytest
+
+from ckanext.check_link.utils import TTLCache, normalize_url
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("http://example.com", "http://example.com/"),
+        ("HTTP://Example.COM/Path", "http://example.com/Path"),
+        ("https://example.com:443/a?b=1#top", "https://example.com/a?b=1"),
+        ("http://example.com:8080/", "http://example.com:8080/"),
+        ("not a url", "not a url"),
+    ],
+)
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
+
+
+class TestTTLCache:
+    def test_expiration(self, monkeypatch):
+        now = [0.0]
+        monkeypatch.setattr("time.monotonic", lambda: now[0])
+        cache = TTLCache(ttl=10)
+        cache.set("a", 1)
+
+        now[0] = 5
+        assert cache.get("a") == 1
+
+        now[0] = 11
+        assert cache.get("a") is None
+
+    def test_least_recent_dropped(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert "a" in cache
+        assert "b" not in cache
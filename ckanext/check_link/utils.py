@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+from urllib.parse import urlsplit, urlunsplit
+
+import ckan.plugins.toolkit as tk
+from ckan.lib.munge import munge_filename
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+T = TypeVar("T")
+
+
+def normalize_url(url: str) -> str:
+    """Return canonical form of the URL that is used for deduplication.
+
+    Scheme and hostname are lowercased, default port and fragment are
+    removed and empty path is replaced with `/`. Query string is kept as is,
+    because it usually affects the response.
+
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if not scheme or not host:
+        return url
+
+    if ":" in host:
+        host = f"[{host}]"
+
+    netloc = host
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+
+    if parts.username or parts.password:
+        credentials = parts.username or ""
+        if parts.password:
+            credentials = f"{credentials}:{parts.password}"
+        netloc = f"{credentials}@{netloc}"
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def resource_url(
+    id_: str, package_id: str, url: Optional[str], url_type: Optional[str]
+) -> str:
+    """Public URL of the resource stored in DB.
+
+    Uploaded resources keep only the filename in the `url` column. Their
+    download URL is built in the same way as in `resource_dictize`, so
+    resources read from DB and from the search index have identical URLs.
+
+    """
+    if url_type != "upload" or not url:
+        return url or ""
+
+    return "{}/dataset/{}/resource/{}/download/{}".format(
+        tk.config.get("ckan.site_url", "").rstrip("/"),
+        package_id,
+        id_,
+        munge_filename(url.rsplit("/")[-1]),
+    )
+
+
+class CheckMemo:
+    """Storage for results of URL checks performed during a single run.
+
+    Put an instance into the action context under `check_link_memo` key and
+    every URL will be checked only once, no matter how many times it is
+    referenced by different resources and packages.
+
+    """
+
+    def __init__(self):
+        self.results: dict[str, dict[str, Any]] = {}
+        self.hits = 0
+        # links that were not checked because of the fresh report
+        self.skipped = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.results
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def get(self, key: str) -> Optional[dict[str, Any]]:
+        return self.results.get(key)
+
+    def add(self, key: str, report: dict[str, Any]):
+        self.results[key] = report
+
+
+class TTLCache(Generic[T]):
+    """Process-level LRU cache whose items expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items: OrderedDict[Hashable, tuple[float, T]] = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def get(self, key: Hashable) -> Optional[T]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        expires, value = item
+        if expires < time.monotonic():
+            del self._items[key]
+            return None
+
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: T):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
@@ -3,15 +3,19 @@ from typing import Any, Optional
 
 import ckan.authz as authz
 import ckan.plugins.toolkit as tk
-from ckan.lib.helpers import Page
-from flask import Blueprint
+from flask import Blueprint, Response
+
+from . import metrics
+from .helpers import get_package_titles
 
 CONFIG_BASE_TEMPLATE = "ckanext.check_link.report.base_template"
 CONFIG_REPORT_URL = "ckanext.check_link.report.url"
+CONFIG_METRICS_URL = "ckanext.check_link.metrics.url"
 
 
 DEFAULT_BASE_TEMPLATE = "check_link/base_admin.html"
 DEFAULT_REPORT_URL = "/check-link/report/global"
+DEFAULT_METRICS_URL = "/check-link/metrics"
 
 
 report_bp = Blueprint("check_link", __name__)
@@ -31,38 +35,65 @@ def report():
     ):
         return tk.abort(403)
 
+    per_page = 20
+    params: dict[str, Any] = {
+        "limit": per_page,
+        "attached_only": False,
+        "exclude_state": ["available"],
+        # the total is taken from cached stats: counting on every request
+        # makes deep pages as slow as the first one
+        "include_count": False,
+    }
+    after = tk.request.args.get("after")
+    if after:
+        params["after"] = after
+
     try:
-        page = max(1, tk.asint(tk.request.args.get("page", 1)))
-    except ValueError:
-        page = 1
+        reports = tk.get_action("check_link_report_search")({}, params)
+    except tk.ValidationError:
+        return tk.abort(400, tk._("Invalid page"))
 
-    per_page = 20
-    reports = tk.get_action("check_link_report_search")(
-        {},
-        {
-            "limit": per_page,
-            "offset": per_page * page - per_page,
-            "attached_only": False,
-            "exclude_state": ["available"],
-        },
+    stats = tk.get_action("check_link_report_stats")(
+        {}, {"exclude_state": ["available"]}
     )
 
-    def pager_url(*args: Any, **kwargs: Any):
-        return tk.url_for("check_link.report", **kwargs)
-
     base_template = tk.config.get(CONFIG_BASE_TEMPLATE, DEFAULT_BASE_TEMPLATE)
     return tk.render(
         "check_link/report.html",
         {
             "base_template": base_template,
-            "page": Page(
-                reports["results"],
-                url=pager_url,
-                page=page,
-                item_count=reports["count"],
-                items_per_page=per_page,
-                presliced_list=True,
+            # titles of applications, that are not included into report details
+            "package_titles": get_package_titles(
+                r["details"].get("package_id")
+                for r in reports["results"]
+                if "resource" not in r["details"]
+            ),
+            "reports": reports["results"],
+            "total": stats["total"],
+            "first_url": tk.url_for("check_link.report") if after else None,
+            "next_url": (
+                tk.url_for("check_link.report", after=reports["next"])
+                if "next" in reports
+                else None
             ),
         },
     )
 
+
+@report_bp.route(
+    tk.config.get(CONFIG_METRICS_URL, DEFAULT_METRICS_URL), endpoint="metrics"
+)
+def export_metrics():
+    """Metrics collected by the current process in Prometheus text format."""
+    if not metrics.is_enabled():
+        return tk.abort(404)
+
+    if not authz.is_authorized_boolean(
+        "check_link_view_metrics", {"user": tk.g.user}, {}
+    ):
+        return tk.abort(403)
+
+    return Response(
+        metrics.registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator
+
+import ckan.model as model
+import ckan.plugins.toolkit as tk
+
+from . import metrics, profiling
+from .logic.action.check import make_engine
+from .utils import CheckMemo
+
+log = logging.getLogger(__name__)
+
+# state of the worker process, initialized by `_init_worker`
+_worker_context: dict[str, Any] = {}
+
+# pools with connections inherited from the parent process. They are never
+# closed, because closing them terminates connections of the parent.
+_inherited_pools: list[Any] = []
+
+
+class ChunkProcessor:
+    """Call check action for every chunk of items.
+
+    When `workers` is greater than one, chunks are sent to the pool of
+    forked processes, each with its own DB connections. Results are still
+    yielded in order of chunks, so that checkpoint of the run always
+    points to the end of contiguous sequence of processed items.
+
+    """
+
+    def __init__(self, action: str, context: dict[str, Any], workers: int = 1):
+        self.action = action
+        self.context = context
+        self.workers = workers
+        self._memo_stats: dict[int, tuple[int, int, int]] = {}
+
+    @property
+    def unique(self) -> int:
+        """Number of URLs checked during the run."""
+        if self.workers > 1:
+            return sum(stats[0] for stats in self._memo_stats.values())
+
+        return len(self.context["check_link_memo"])
+
+    @property
+    def hits(self) -> int:
+        """Number of results reused instead of checking URL again."""
+        if self.workers > 1:
+            return sum(stats[1] for stats in self._memo_stats.values())
+
+        return self.context["check_link_memo"].hits
+
+    @property
+    def skipped(self) -> int:
+        """Number of links skipped because their reports are fresh."""
+        if self.workers > 1:
+            return sum(stats[2] for stats in self._memo_stats.values())
+
+        return self.context["check_link_memo"].skipped
+
+    def process(
+        self,
+        items: Iterable[Any],
+        size: int,
+        make_payload: Callable[[list[Any]], dict[str, Any]],
+    ) -> Iterator[tuple[list[Any], list[dict[str, Any]]]]:
+        """Yield every chunk together with reports about its links."""
+        chunks = iter(lambda: list(islice(items, size)), [])
+
+        if self.workers <= 1:
+            check = tk.get_action(self.action)
+            for buff in chunks:
+                yield buff, check(self.context.copy(), make_payload(buff))
+            return
+
+        # connections of the parent are released before forking, so workers
+        # start with the empty pool
+        model.Session.remove()
+        model.meta.engine.dispose()
+
+        with ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_worker,
+            initargs=(self.context["user"],),
+        ) as executor:
+            pending: deque[tuple[list[Any], Future[Any]]] = deque()
+
+            for buff in chunks:
+                pending.append(
+                    (
+                        buff,
+                        executor.submit(_check_chunk, self.action, make_payload(buff)),
+                    )
+                )
+                # keep every worker busy, but do not enumerate the whole scope
+                # ahead of processing
+                metrics.chunks_in_flight.set(len(pending))
+                if len(pending) >= self.workers * 2:
+                    yield self._collect(*pending.popleft())
+
+            while pending:
+                yield self._collect(*pending.popleft())
+            metrics.chunks_in_flight.set(0)
+
+    def _collect(
+        self, buff: list[Any], future: Future[Any]
+    ) -> tuple[list[Any], list[dict[str, Any]]]:
+        result, pid, memo_stats, samples, timings = future.result()
+        self._memo_stats[pid] = memo_stats
+        metrics.registry.merge(samples)
+
+        profile = profiling.active()
+        if profile is not None and timings is not None:
+            profile.merge(timings)
+        return buff, result
+
+
+def _init_worker(user: str):
+    engine = model.meta.engine
+    try:
+        engine.dispose(close=False)
+    except TypeError:
+        # SQLAlchemy<1.4.33 cannot detach pool without closing connections
+        _inherited_pools.append(engine.pool)
+        engine.pool = engine.pool.recreate()
+
+    # samples collected by the parent before forking belong to the parent
+    metrics.registry.clear()
+    profiling.reset()
+
+    _worker_context.update(
+        user=user, check_link_memo=CheckMemo(), check_link_engine=make_engine()
+    )
+
+
+def _check_chunk(action: str, data_dict: dict[str, Any]):
+    memo: CheckMemo = _worker_context["check_link_memo"]
+    try:
+        result = tk.get_action(action)(_worker_context.copy(), data_dict)
+    finally:
+        model.Session.remove()
+
+    # samples are moved to the parent process, that exports them
+    profile = profiling.active()
+    return (
+        result,
+        os.getpid(),
+        (len(memo), memo.hits, memo.skipped),
+        metrics.registry.pop(),
+        profile.pop() if profile is not None else None,
+    )